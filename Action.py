@@ -0,0 +1,277 @@
+# Action module
+# batched action of permutations on elements of the exterior algebra of an indexed vector space
+# a batch of elements of the kth exterior power is stored in CSR form: the terms of element j are the entries
+# indptr[j]:indptr[j+1] of the arrays of coefficients, monomial bitmasks and (sorted) basis indices of the monomials
+# a permutation of the basis acts on all terms at once by gathers, with signs from vectorized inversion counts
+# wedge products of a batch with fixed elements are likewise built at once, from tables of target monomials and signs
+
+import Lazy
+import ExteriorAlg as ea
+import Subsets as ss
+from fractions import Fraction
+
+numpy = Lazy.module('numpy')
+sparse = Lazy.module('scipy.sparse')
+
+# helper functions
+
+# returns the dtype for bitmasks over N basis vectors, falling back to python integers if they do not fit in int64
+def maskDtype(N):
+	if N <= 63:
+		return numpy.int64
+	return object
+
+# returns the bitmasks of rows of basis indices
+def masksOf(bits, dtype):
+	masks = numpy.zeros(len(bits), dtype=dtype)
+	one = numpy.ones(len(bits), dtype=dtype)
+	for column in bits.T:
+		masks |= one << column.astype(dtype)
+
+	return masks
+
+# returns the rows of sorted basis indices of bitmasks of monomials of the kth exterior power of an N dimensional space
+def bitsOf(masks, k, N):
+	if maskDtype(N) == object:
+		return numpy.array([ea.basisIndices(mask) for mask in masks], dtype=numpy.int64).reshape(len(masks), k)
+
+	masks = numpy.asarray(masks, dtype=numpy.int64)
+	bits = numpy.zeros((len(masks), k), dtype=numpy.int64)
+	found = numpy.zeros(len(masks), dtype=numpy.int64)
+	for b in range(N):
+		present = numpy.flatnonzero((masks >> b) & 1)
+		bits[present, found[present]] = b
+		found[present] += 1
+
+	return bits
+
+# applies a permutation of the basis (as an integer array) to rows of sorted basis indices
+# returns the sorted permuted rows and the sign of each permutation of the row
+def permuteBits(permV, bits):
+	permuted = permV[bits]
+	inversions = numpy.zeros(len(bits), dtype=numpy.int64)
+	for a in range(bits.shape[1]):
+		for b in range(a + 1, bits.shape[1]):
+			inversions += permuted[:, a] > permuted[:, b]
+	permuted.sort(axis=1)
+
+	return permuted, 1 - 2 * (inversions % 2)
+
+# returns the ranks of rows of sorted basis indices in the combinatorial number system (see Subsets.rank)
+def colexRanks(bits):
+	ranks = numpy.zeros(len(bits), dtype=numpy.int64)
+	if len(bits) == 0:
+		return ranks
+	top = int(bits.max())
+	for t in range(bits.shape[1]):
+		table = numpy.array([ss.binomial(c, t + 1) for c in range(top + 1)], dtype=numpy.int64)
+		ranks += table[bits[:, t]]
+
+	return ranks
+
+# returns a function mapping arrays of bitmasks to their indices, given a dict from bitmasks to indices
+def indexLookup(indices, dtype):
+	masks = numpy.array(indices.keys(), dtype=dtype)
+	values = numpy.array(indices.values(), dtype=numpy.int64)
+	order = numpy.argsort(masks)
+	masks, values = masks[order], values[order]
+
+	return lambda query: values[numpy.searchsorted(masks, query)]
+
+# returns the rows of sorted basis indices of the k-subsets of the given ranks in the combinatorial number system,
+# for subsets of range(N) (see Subsets.unrank)
+def colexUnrank(ranks, k, N):
+	ranks = numpy.array(ranks, dtype=numpy.int64)
+	bits = numpy.zeros((len(ranks), k), dtype=numpy.int64)
+	for t in range(k, 0, -1):
+		table = numpy.array([ss.binomial(c, t) for c in range(N)], dtype=numpy.int64)
+		bits[:, t - 1] = numpy.searchsorted(table, ranks, side='right') - 1
+		ranks -= table[bits[:, t - 1]]
+
+	return bits
+
+# returns the table of the products m ^ f of monomials m, given as rows of sorted basis indices, with a monomial f,
+# given by its sorted basis indices: whether each product is nonzero, the rank of its monomial in the combinatorial
+# number system, and its sign, which is that of the interleaving of f into m
+def wedgeTable(bits, factorBits):
+	factorBits = numpy.array(factorBits, dtype=numpy.int64)
+	nonzero = ~(bits[:, :, None] == factorBits).any(axis=(1, 2))
+	inversions = (bits[:, :, None] > factorBits).sum(axis=(1, 2))
+	union = numpy.concatenate([bits, numpy.tile(factorBits, (len(bits), 1))], axis=1)
+	union.sort(axis=1)
+
+	return nonzero, colexRanks(union), 1 - 2 * (inversions % 2)
+
+# returns the CSR matrix of the given rows of a CSR matrix
+# gathers the terms directly, as scipy's row indexing (before 1.3) multiplies by a selection matrix, allocating arrays
+# as long as a row, which for matrices over the monomials of a large exterior power far outgrows the rows themselves
+def selectRows(matrix, rows):
+	rows = numpy.asarray(rows, dtype=numpy.int64)
+	starts, stops = matrix.indptr[rows], matrix.indptr[rows + 1]
+	indptr = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+	numpy.cumsum(stops - starts, out=indptr[1:])
+	terms = numpy.arange(indptr[-1], dtype=numpy.int64) + numpy.repeat(starts - indptr[:-1], stops - starts)
+	return sparse.csr_matrix((matrix.data[terms], matrix.indices[terms], indptr), shape=(len(rows), matrix.shape[1]))
+
+# generates the nonempty rows of a CSR matrix over the monomials of the kth exterior power of an N dimensional space,
+# indexed by rank in the combinatorial number system, as dicts from monomial bitmasks to coefficients
+# assumes the matrix has no explicit zeros
+def matrixRows(matrix, k, N):
+	masks = masksOf(colexUnrank(matrix.indices, k, N), maskDtype(N)).tolist()
+	coeffs = matrix.data.tolist()
+	indptr = matrix.indptr.tolist()
+	for start, stop in zip(indptr[:-1], indptr[1:]):
+		if stop > start:
+			yield dict(zip(masks[start:stop], coeffs[start:stop]))
+
+# class ElementBatch
+# a list of elements of the kth exterior power of an N dimensional space, in CSR form
+
+class ElementBatch:
+	def __init__(self, elements, k, N):
+		indptr = numpy.zeros(len(elements) + 1, dtype=numpy.int64)
+		numpy.cumsum([len(elt.monomials) for elt in elements], out=indptr[1:])
+
+		coeffs = [coeff for elt in elements for coeff in elt.coeffs]
+		masks = [mask for elt in elements for mask in elt.monomials]
+		try:
+			coeffs = numpy.array(coeffs, dtype=numpy.int64)
+		except OverflowError:
+			coeffs = numpy.array(coeffs, dtype=object)
+		bits = numpy.array([ea.basisIndices(mask) for mask in masks], dtype=numpy.int64).reshape(len(masks), k)
+
+		self.setTerms(k, N, indptr, coeffs, numpy.array(masks, dtype=maskDtype(N)), bits)
+
+	# sets the terms of the batch from the CSR arrays: the row pointers, and the coefficients, bitmasks and sorted basis
+	# indices of the terms, each row sorted by monomial
+	def setTerms(self, k, N, indptr, coeffs, masks, bits):
+		self.k = k
+		self.dtype = maskDtype(N)
+		self.indptr = indptr
+		self.rows = numpy.repeat(numpy.arange(len(indptr) - 1), numpy.diff(indptr))
+		self.coeffs = coeffs
+		self.masks = masks
+		self.bits = bits
+
+		# keys sorting the terms by row and then by monomial, for looking up the coefficient of a monomial in a row
+		self.distinctMasks, maskRanks = numpy.unique(self.masks, return_inverse=True)
+		self.keys = self.rows * len(self.distinctMasks) + maskRanks
+
+	def __len__(self):
+		return len(self.indptr) - 1
+
+	# returns the matrix with columns the elements of the batch, over the monomials of the kth exterior power
+	# monomials are indexed by lookup (see indexLookup), or by their rank in the combinatorial number system if it is None
+	def matrix(self, numMonomials, lookup=None):
+		if lookup is None:
+			rowIndices = colexRanks(self.bits)
+		else:
+			rowIndices = lookup(self.masks)
+		return sparse.csr_matrix((self.coeffs, (rowIndices, self.rows)), shape=(numMonomials, len(self)))
+
+	# returns the matrix with columns the images of the elements of the batch under a permutation of the basis
+	# monomials are indexed as in matrix
+	def actionMatrix(self, permV, numMonomials, lookup=None):
+		permuted, signs = permuteBits(numpy.asarray(permV), self.bits)
+		data = self.coeffs * signs
+		if lookup is None:
+			rowIndices = colexRanks(permuted)
+		else:
+			rowIndices = lookup(masksOf(permuted, self.dtype))
+		return sparse.csc_matrix((data, (rowIndices, self.rows)), shape=(numMonomials, len(self)))
+
+	# generates the images of the elements of the batch under each of a list of permutations of the basis, as dicts
+	# from monomial bitmasks to coefficients, all images under the first permutation first
+	# the permutations act on all terms at once, indexing the flattened permutations past an offset for each
+	def actionRows(self, permVs):
+		permVs = numpy.asarray(permVs)
+		N = permVs.shape[1]
+		offsets = N * numpy.arange(len(permVs)).reshape(len(permVs), 1, 1)
+		permuted, signs = permuteBits(permVs.ravel(), (self.bits + offsets).reshape(-1, self.k))
+		masks = masksOf(permuted, self.dtype).tolist()
+		coeffs = (numpy.tile(self.coeffs, len(permVs)) * signs).tolist()
+
+		bounds = zip(self.indptr[:-1].tolist(), self.indptr[1:].tolist())
+		for offset in xrange(0, len(masks), len(self.coeffs)):
+			for start, stop in bounds:
+				yield dict(zip(masks[offset + start:offset + stop], coeffs[offset + start:offset + stop]))
+
+	# returns the matrix with rows the products b ^ f of the elements b of the batch with each of a list of elements f,
+	# or f ^ b if left is set, over the monomials of the (k+d)th exterior power indexed by their rank in the combinatorial
+	# number system, where the factors all lie in the dth exterior power
+	# the product of the jth element with the fth factor is in row f len(batch) + j
+	# the products are assembled in bulk from one wedgeTable per distinct monomial of the factors
+	def wedge(self, factors, N, left=False):
+		d = ea.popcount(factors[0].monomials[0]) if factors and factors[0].monomials else 0
+		tables = {}
+		rows, ranks, coeffs = [], [], []
+		for f, factor in enumerate(factors):
+			for coeff, mask in zip(factor.coeffs, factor.monomials):
+				if mask not in tables:
+					tables[mask] = wedgeTable(self.bits, ea.basisIndices(mask))
+				nonzero, targets, signs = tables[mask]
+				rows.append(f * len(self) + self.rows[nonzero])
+				ranks.append(targets[nonzero])
+				coeffs.append(self.coeffs[nonzero] * signs[nonzero] * coeff)
+
+		shape = (len(factors) * len(self), ss.binomial(N, self.k + d))
+		if not rows:
+			return sparse.csr_matrix(shape, dtype=self.coeffs.dtype)
+		coeffs = numpy.concatenate(coeffs)
+		if left and self.k * d % 2:
+			coeffs = -coeffs
+		result = sparse.csr_matrix((coeffs, (numpy.concatenate(rows), numpy.concatenate(ranks))), shape=shape)
+		result.eliminate_zeros()
+
+		return result
+
+	# returns the trace of a permutation of the basis on the span of the batch
+	# assumes the batch is a basis in reduced echelon form, sorted by leading monomial, and that its span is invariant
+	# passed the inverse of the permutation: the coordinate of perm(b) along a basis element b with leading monomial c
+	# is the coefficient in b of perm^-1(c), times its sign, divided by the coefficient of c
+	def leadTrace(self, inversePermV):
+		if len(self) == 0:
+			return 0
+
+		leads = self.indptr[:-1]
+		targets, signs = permuteBits(numpy.asarray(inversePermV), self.bits[leads])
+		targetMasks = masksOf(targets, self.dtype)
+
+		# look the targets up in their rows
+		distinctMasks, keys = self.distinctMasks, self.keys
+		targetRanks = numpy.minimum(numpy.searchsorted(distinctMasks, targetMasks), len(distinctMasks) - 1)
+		targetKeys = numpy.arange(len(self)) * len(distinctMasks) + targetRanks
+		positions = numpy.minimum(numpy.searchsorted(keys, targetKeys), len(keys) - 1)
+		found = (distinctMasks[targetRanks] == targetMasks) & (keys[positions] == targetKeys)
+
+		numerators = (self.coeffs[positions] * signs)[found]
+		denominators = self.coeffs[leads][found]
+
+		# sum exactly, grouping the terms by denominator
+		trace = Fraction(0)
+		for denominator in numpy.unique(denominators):
+			trace += Fraction(int(numerators[denominators == denominator].sum()), int(denominator))
+
+		if trace.denominator == 1:
+			return trace.numerator
+		return trace
+
+# returns the batch of the rows of a CSR matrix over the monomials of the kth exterior power of an N dimensional space,
+# indexed by rank in the combinatorial number system, such as the products returned by ElementBatch.wedge
+# sorts the indices of the matrix in place, and assumes it has no explicit zeros
+def batchFromMatrix(matrix, k, N):
+	matrix.sort_indices()
+	bits = colexUnrank(matrix.indices, k, N)
+	batch = ElementBatch([], k, N)
+	batch.setTerms(k, N, matrix.indptr.astype(numpy.int64), matrix.data, masksOf(bits, maskDtype(N)), bits)
+
+	return batch
+
+# returns the batch of the monomials of the kth exterior power given by rows of sorted basis indices, each with
+# coefficient 1
+def monomialBatch(bits, k, N):
+	bits = numpy.array(bits, dtype=numpy.int64).reshape(len(bits), k)
+	batch = ElementBatch([], k, N)
+	batch.setTerms(k, N, numpy.arange(len(bits) + 1), numpy.ones(len(bits), dtype=numpy.int64), masksOf(bits, maskDtype(N)), bits)
+
+	return batch
@@ -0,0 +1,198 @@
+# Benchmark module
+# times and memory-profiles the stages of the character pipeline over a grid of (n, i)
+# USAGE: python Benchmark.py m n I historyfile [baselinefile]
+#        python Benchmark.py baseline historyfile baselinefile
+#
+# the first form benchmarks V_m through V_n for i = 2, ..., I and appends a record to historyfile, a file of JSON lines,
+# comparing it against the record in baselinefile if given; the second form makes the latest record the baseline
+# each (n, i) runs in a fresh forked process, so every stage starts from cold memoization tables and the ideal cache
+# is bypassed, and the peak resident memory after each stage is that of the process running it
+# a stage regresses if it is slower (or bigger) than in the baseline by more than a relative tolerance and
+# an absolute noise floor
+
+import os
+import sys
+import json
+import time
+import pickle
+import platform
+import resource
+import subprocess
+from sys import argv
+
+# relative tolerance and noise floors for flagging regressions
+tolerance = .2
+secondsFloor = .05
+peakFloor = 1024
+
+# helper functions
+
+# returns the peak resident memory of the current process so far, in kilobytes
+def peakKB():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# returns the git revision of the working tree, or None outside of a git checkout
+def revision():
+	try:
+		with open(os.devnull, 'w') as devnull:
+			return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull,
+				cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+# runs f() in a forked process with its output discarded, returning what it returns (which must be picklable)
+def forked(f):
+	readEnd, writeEnd = os.pipe()
+	pid = os.fork()
+	if pid == 0:
+		os.close(readEnd)
+		devnull = os.open(os.devnull, os.O_WRONLY)
+		os.dup2(devnull, 1)
+		status = 0
+		try:
+			result = f()
+		except BaseException as error:
+			result = error
+			status = 1
+		with os.fdopen(writeEnd, 'wb') as output:
+			pickle.dump(result, output, pickle.HIGHEST_PROTOCOL)
+		os._exit(status)
+
+	os.close(writeEnd)
+	with os.fdopen(readEnd, 'rb') as inputFile:
+		result = pickle.load(inputFile)
+	os.waitpid(pid, 0)
+
+	if isinstance(result, BaseException):
+		raise result
+	return result
+
+# class StageTimer
+# records the time taken and the peak memory after each of a sequence of stages
+
+class StageTimer:
+	def __init__(self, n, i):
+		self.n = n
+		self.i = i
+		self.results = []
+
+	# runs f(), recording it as the given stage, and returns what it returns
+	def stage(self, name, f):
+		start = time.time()
+		result = f()
+		self.results.append({'stage': name, 'n': self.n, 'i': self.i, 'seconds': time.time() - start, 'peakKB': peakKB()})
+
+		return result
+
+# benchmarks the stages of Bonus.character(n, i), returning the stage results and the character values
+def characterStages(n, i):
+	import Bonus
+	import Perm
+	import Action
+
+	timer = StageTimer(n, i)
+	start = time.time()
+	extVVals = timer.stage('characterExtV', lambda: Bonus.characterExtV(n, i))
+	idealBasis = timer.stage('ideal', lambda: Bonus.ideal(n, i))
+	timer.stage('idealBasisMatrix', lambda: Bonus.idealBasisMatrix(n, i, idealBasis))
+	idealBatch = timer.stage('ElementBatch', lambda: Action.ElementBatch(idealBasis, i, len(Bonus.V(n))))
+	perms = [Perm.fromCycleType(n, cycleType) for cycleType in Perm.partitions(1, n)]
+	idealVals = timer.stage('charVal', lambda: [Bonus.charVal(n, i, idealBatch, perm) for perm in perms])
+	timer.results.append({'stage': 'character', 'n': n, 'i': i, 'seconds': time.time() - start, 'peakKB': peakKB()})
+
+	return timer.results, [extVVal - idealVal for extVVal, idealVal in zip(extVVals, idealVals)]
+
+# benchmarks interpolating the character values of V_x through V_n by a cycle polynomial, with automatic refinement
+# the candidate terms are Interpolate.likelyMonomials(2i, 2i), and an underdetermined interpolation is timed all the same
+def interpolationStages(x, n, i, characterVals):
+	import Interpolate
+	import CyclePolynomials as cp
+
+	def interpolate():
+		try:
+			soln = cp.multiInterpolate(x, n, characterVals, Interpolate.likelyMonomials(2 * i, 2 * i))
+			Interpolate.refineCyclePoly(x, n, characterVals, soln)
+		except ValueError:
+			pass
+
+	timer = StageTimer(n, i)
+	timer.stage('multiInterpolate', interpolate)
+
+	return timer.results
+
+# benchmarks the grid of V_m through V_n and i = 2, ..., I, returning a history record
+def benchmark(m, n, I):
+	results = []
+	for i in range(2, I + 1):
+		characterVals = []
+		x = None
+		for k in range(m, n + 1):
+			# skip V_k whose ith exterior power vanishes
+			if k * (k - 1) / 2 < i:
+				continue
+			stageResults, values = forked(lambda: characterStages(k, i))
+			results.extend(stageResults)
+			characterVals.extend(values)
+			if x is None:
+				x = k
+		if x is not None:
+			results.extend(forked(lambda: interpolationStages(x, n, i, characterVals)))
+
+	return {
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'revision': revision(),
+		'host': platform.node(),
+		'python': platform.python_version(),
+		'grid': [m, n, I],
+		'results': results
+	}
+
+# returns the list of regressions of a record against a baseline record, as strings
+def regressions(record, baseline):
+	baselineResults = {(result['stage'], result['n'], result['i']): result for result in baseline['results']}
+	result = []
+	for stageResult in record['results']:
+		key = stageResult['stage'], stageResult['n'], stageResult['i']
+		if key not in baselineResults:
+			continue
+		old = baselineResults[key]
+		for measure, floor in [('seconds', secondsFloor), ('peakKB', peakFloor)]:
+			if stageResult[measure] > old[measure] * (1 + tolerance) and stageResult[measure] - old[measure] > floor:
+				result.append('{} n={} i={}: {} {:.3f} -> {:.3f}'.format(key[0], key[1], key[2], measure, old[measure], stageResult[measure]))
+
+	return result
+
+# returns the last record of a history file
+def lastRecord(historyFilename):
+	record = None
+	with open(historyFilename) as historyFile:
+		for line in historyFile:
+			if line.strip():
+				record = json.loads(line)
+
+	return record
+
+# main function, runs the benchmark grid or sets the baseline, given the command line arguments args (without the
+# program name)
+def main(args):
+	if args[0] == 'baseline':
+		with open(args[2], 'w') as baselineFile:
+			json.dump(lastRecord(args[1]), baselineFile, sort_keys=True)
+	else:
+		record = benchmark(int(args[0]), int(args[1]), int(args[2]))
+		with open(args[3], 'a') as historyFile:
+			historyFile.write(json.dumps(record, sort_keys=True) + '\n')
+
+		for stageResult in record['results']:
+			print('{stage:>16} n={n:<3} i={i:<3} {seconds:10.3f}s {peakKB:10d}KB'.format(**stageResult))
+
+		if len(args) > 4:
+			with open(args[4]) as baselineFile:
+				found = regressions(record, json.load(baselineFile))
+			for regression in found:
+				print('REGRESSION ' + regression)
+			if found:
+				sys.exit(1)
+
+if __name__ == '__main__':
+	main(argv[1:])
@@ -1,14 +1,32 @@
 # Bonus module
 # contains code specific for the Bonus problem from Math 267, HW 6
-# USAGE: python Bonus.py m n i filename
+# USAGE: python Bonus.py m n i filename [processes]
+#        python Bonus.py sweep m n I filename
+#        python Bonus.py dimensions m n I [modular]
+# the second form computes the characters for i = 2, ..., I in one pass per V_k, extending the ideal degree by degree,
+# and the third only prints the dimensions of the ideals and quotients (see dimensionGrid)
+# progress is shown with ETAs, and if BONUS_METRICS_FILE is set, metrics are written to it (see Instrument)
+# if BONUS_SHARD_DIR is set, ideals are computed out of core in that directory (see shardedCharacter)
+# characters already in the results store are skipped, and work in progress is checkpointed in the directory
+# filename.checkpoints, so a restarted run resumes where it stopped
 
 import ExteriorAlg as ea
 import Subsets as ss
 import Perm
-import pickle
+import Cache
+import Results
+import Action
+import Instrument
+import Checkpoint
+import Elimination
+import Shards
+import Lazy
+import os
+import itertools
+from fractions import Fraction
 from sys import argv
-from scipy.sparse import *
-from scipy.sparse.linalg import spsolve
+
+numpy = Lazy.module('numpy')
 
 # helper function for various functions
 def sgn(m):
@@ -29,158 +47,554 @@ def makePair(i, j):
 def V(n):
 	return [(i, j) for i in range(n) for j in range(n) if i < j]
 
+# returns the index of the basis vector (i,j) of V_n, ordered by j and then i
+# the index does not depend on n, so wedge monomials of V_n are bitmasks over these indices
+def pairIndex(i, j):
+	if i > j:
+		i, j = j, i
+	return j * (j - 1) / 2 + i
+
 # applies a permutation to a basis vector of V_n
 def applyPermV(perm, elt):
 	i, j = elt
 	return makePair(perm[i], perm[j])
 
-# defines the vector R_{i,j,k}
+# returns the permutation of the basis indices of V_n induced by a permutation of range(n)
+def inducedPermV(perm):
+	result = [0] * len(V(len(perm)))
+	for i, j in V(len(perm)):
+		result[pairIndex(i, j)] = pairIndex(perm[i], perm[j])
+
+	return result
+
+# elements R_{j,k,l} already computed, keyed by (j, k, l)
+RCache = {}
+
+# defines the vector R_{j,k,l}
+# the result is cached, so it must not be modified
 def R(j, k, l):
-	return ea.Element(map(ea.standardForm, [(1, [makePair(j, k), makePair(k, l)]), 
-											(1, [makePair(k, l), makePair(l, j)]),
-											(1, [makePair(l, j), makePair(j, k)])]))
+	if (j, k, l) not in RCache:
+		result = ea.Element(*zip(*[ea.standardForm(1, [pairIndex(j, k), pairIndex(k, l)]),
+								ea.standardForm(1, [pairIndex(k, l), pairIndex(l, j)]),
+								ea.standardForm(1, [pairIndex(l, j), pairIndex(j, k)])]))
+		result.standardForm()
+		RCache[j, k, l] = result
+
+	return RCache[j, k, l]
+
+# returns the distinct elements R_{j,k,l} (up to sign) that generate the ideal of the exterior algebra of V_n
+# R_{j,k,l} only depends on the cyclic order of j,k,l, so this keeps one element per triple and cyclic order
+def idealRs(n):
+	result = []
+	seen = set()
+	for j in range(n):
+		for k in range(n):
+			for l in range(n):
+				if (j<k and k<l) or (j<l and l<k) or (k<j and j<l):
+					r = R(j, k, l)
+					key = tuple(r.monomials), tuple(coeff * r.coeffs[0] for coeff in r.coeffs)
+					if key not in seen:
+						seen.add(key)
+						result.append(r)
 
-# applies a permutation to an element of the kth exterior power of V_n
-def applyPermExtV(perm, elt):
-	permutedElt = []
-	for coeff, basisVector in elt.coeffVectorPairs:
-		permutedElt.append((coeff, map(lambda x: applyPermV(perm, x), basisVector)))
+	return result
 
-	result = ea.Element(permutedElt)
+# applies a permutation to an element of the kth exterior power of V_n
+# the permutation induced on the basis of V_n may be passed to save time
+def applyPermExtV(perm, elt, permV=None):
+	if permV is None:
+		permV = inducedPermV(perm)
+
+	coeffs, monomials = [], []
+	for coeff, mask in zip(elt.coeffs, elt.monomials):
+		newCoeff, newMask = ea.standardForm(coeff, [permV[b] for b in ea.basisIndices(mask)])
+		coeffs.append(newCoeff)
+		monomials.append(newMask)
+
+	result = ea.Element(coeffs, monomials)
 	result.standardForm()
 
 	return result
 
-# returns a generating set for the ideal of the ith exterior power of V_n
-def ideal(n, i):
-	# compute a basis for the (i-2)nd  exterior power
-	basis = [ea.Element([(1, basisVector)]) for basisVector in ss.subsets(V(n), i - 2)]
+# number of monomials multiplied at once when generators are built in bulk
+generatorChunkSize = 1024
+
+# returns the number of generators x ^ R_t of the ideal of the ith exterior power of V_n, counting zero and repeated
+# ones, an upper bound on the number of rows eliminated, used as the total of progress reports
+def generatorBound(n, i):
+	return ss.binomial(len(V(n)), i - 2) * ss.binomial(n, 3)
+
+# returns the indices of the nonzero rows of a CSR matrix with sorted indices, skipping rows equal up to sign to an
+# earlier row
+def distinctRows(matrix):
+	indptr, indices, coeffs = matrix.indptr.tolist(), matrix.indices.tolist(), matrix.data.tolist()
+	result = []
+	seen = set()
+	for row in range(len(indptr) - 1):
+		start, stop = indptr[row], indptr[row + 1]
+		if stop == start:
+			continue
+		key = tuple(indices[start:stop]), tuple(coeff * coeffs[start] for coeff in coeffs[start:stop])
+		if key not in seen:
+			seen.add(key)
+			result.append(row)
 
-	# compute a generating set for the ideal
-	genSet = []
-	for j in range(n):
-		for k in range(n):
-			for l in range(n):
-				if (i<j and j<k) or (i<k and k<j) or (j<i and i<k):
-					genSet.extend([x.mult(R(j, k, l)) for x in basis])
+	return result
 
-	# remove empty elements
-	genSet = filter(lambda x: x.coeffVectorPairs, genSet)
+# generates a spanning set for the ideal of the ith exterior power of V_n, lazily, as dicts from monomials to coefficients
+# the products of each chunk of a basis for the (i-2)nd exterior power with all the R_t are built in bulk
+# zero products are skipped, and so are products repeating (up to sign) an earlier one of the same chunk, which are
+# cheap to find and only ever held a chunk at a time
+# chunkSize is the number of monomials of the (i-2)nd exterior power in each chunk
+def idealGenerators(n, i, chunkSize=generatorChunkSize):
+	N = len(V(n))
+	Rs = idealRs(n)
+	subsets = ss.iterSubsets(range(N), i - 2)
+	while True:
+		chunk = list(itertools.islice(subsets, chunkSize))
+		if not chunk:
+			break
+		products = Action.monomialBatch(chunk, i - 2, N).wedge(Rs, N)
+		products.sort_indices()
+		for row in Action.matrixRows(Action.selectRows(products, distinctRows(products)), i, N):
+			yield row
+
+# returns a basis for the ideal of the ith exterior power of V_n, in reduced echelon form
+# the generators are streamed into the elimination, so memory is bounded by the size of the basis
+# elimination saves to and resumes from checkpoint, if given (see Elimination.rowBasis)
+def ideal(n, i, checkpoint=None):
+	with Instrument.stage('ideal basis', n=n, i=i):
+		generators = Instrument.counted('generators', idealGenerators(n, i))
+		return ea.rowSpanBasis(generators, reduced=True, checkpoint=checkpoint, total=generatorBound(n, i))
+
+# returns a basis for the ideal of the ith exterior power of V_n, in reduced echelon form, for i >= 3, from the basis for
+# the ideal of the (i-1)st exterior power
+# the ideal is spanned by the products e_v ^ b of the basis vectors of V_n with the previous basis elements b, and the
+# leading monomial of e_v ^ b is that of b with v added, for v not in it; so the products with distinct leading monomials,
+# the sparsest for each, are independent and are eliminated alone, without the far more numerous other products
+# they span the ideal if every product equals its combination of the rows of their reduced echelon form given by its
+# coefficients of the leading monomials, which is checked exactly at once by sparse matrix products
+# if the check cannot be made in int64 or fails, all the products are eliminated as for ideal
+def extendIdeal(n, i, previousBasis):
+	if not previousBasis:
+		return []
+
+	with Instrument.stage('ideal extension', n=n, i=i):
+		N = len(V(n))
+		previousBatch = Action.ElementBatch(previousBasis, i - 1, N)
+		if previousBatch.coeffs.dtype == object:
+			return ideal(n, i)
+		products = previousBatch.wedge([ea.Element([1], [1 << v]) for v in range(N)], N, left=True)
+		products.sort_indices()
+		lengths = numpy.diff(products.indptr)
+		nonzero = numpy.flatnonzero(lengths)
+		if len(nonzero) == 0:
+			return []
+		leads = products.indices[products.indptr[nonzero]]
+		order = numpy.lexsort((lengths[nonzero], leads))
+		first = numpy.ones(len(order), dtype=bool)
+		first[1:] = leads[order][1:] != leads[order][:-1]
+		Instrument.count('generators', int(first.sum()))
+
+		basis = ea.rowSpanBasis(Action.matrixRows(products[nonzero[order][first]], i, N), reduced=True, bufferSize=None,
+			total=int(first.sum()))
+		batch = Action.ElementBatch(basis, i, N)
+		leadIndices = batch.indptr[:-1]
+		# python integers, as the bound itself may overflow int64
+		bound = max(int(abs(products.data).max()), int(abs(batch.coeffs).max())) ** 2 * max(int(lengths.max()), 1)
+		if batch.coeffs.dtype != object and (batch.coeffs[leadIndices] == 1).all() and bound < 2 ** 62:
+			basisMatrix = batch.matrix(products.shape[1]).T.tocsr()
+			residual = products - products[:, Action.colexRanks(batch.bits[leadIndices])].dot(basisMatrix)
+			residual.eliminate_zeros()
+			if residual.nnz == 0:
+				return basis
+
+		Instrument.count('extension fallbacks')
+		return ea.rowSpanBasis(Action.matrixRows(products, i, N), reduced=True, total=products.shape[0])
+
+# returns the dimension of the ideal of the ith exterior power of V_n, as the rank of its generators over GF(modulus)
+# which is only smaller than the true dimension if modulus divides certain minors, unlikely for a prime near 2^31
+# no basis is formed, and elimination stops as soon as the rank reaches the dimension of the exterior power
+# if the basis is in idealCache, the dimension is read off from it instead
+def idealDimension(n, i, modulus=Elimination.defaultModulus):
+	if i < 2:
+		return 0
+	if idealCache is not None:
+		arrays = idealCache.load(('ideal', n, i))
+		if arrays is not None:
+			Instrument.count('ideal cache hits')
+			return len(arrays['indptr']) - 1
+
+	with Instrument.stage('ideal dimension', n=n, i=i):
+		generators = Instrument.counted('generators', idealGenerators(n, i))
+		return Elimination.rowRank(generators, modulus, bufferSize=1, bound=ss.binomial(len(V(n)), i))
+
+# returns the dimension of the ith exterior power of V_n, cross-checked against characterExtV at the identity (the
+# first cycle type)
+def exteriorDimension(n, i):
+	result = ss.binomial(len(V(n)), i)
+	if characterExtV(n, i)[0] != result:
+		raise ArithmeticError('characterExtV({}, {}) at the identity is {}, not {}'.format(n, i, characterExtV(n, i)[0], result))
 
-	ea.getBasis(genSet)
+	return result
 
-	return genSet
+# returns the dimensions of the ith exterior power of V_n, of the ideal in it and of the quotient, which is the value
+# of the character at the identity, by idealDimension
+def dimensions(n, i, modulus=Elimination.defaultModulus):
+	exterior = exteriorDimension(n, i)
+	idealDim = idealDimension(n, i, modulus)
+
+	return exterior, idealDim, exterior - idealDim
+
+# cache of ideal bases shared by all runs, or None to always recompute
+idealCache = Cache.Cache() if Cache.defaultDirectory else None
+
+# returns ideal(n, i), loading it from idealCache if it has been computed before
+# if the basis for the ideal of the (i-1)st exterior power is passed and i >= 3, the basis is computed by extendIdeal
+def cachedIdeal(n, i, checkpoint=None, previousBasis=None):
+	compute = lambda: ideal(n, i, checkpoint=checkpoint)
+	if previousBasis is not None and i >= 3:
+		compute = lambda: extendIdeal(n, i, previousBasis)
+	if idealCache is None:
+		return compute()
+
+	key = ('ideal', n, i)
+	arrays = idealCache.load(key)
+	if arrays is not None:
+		Instrument.count('ideal cache hits')
+		return Cache.elementsFromArrays(arrays)
+
+	idealBasis = compute()
+	arrays = Cache.elementsToArrays(idealBasis, i)
+	if arrays is not None:
+		idealCache.store(key, arrays)
+
+	return idealBasis
+
+# generates (i, basis for the ideal of the ith exterior power of V_n) for i = 2, ..., I
+# the ideal is spanned by the R_t in degree 2, and each later degree is extended from the last
+def gradedIdeals(n, I):
+	basis = None
+	for i in range(2, I + 1):
+		basis = cachedIdeal(n, i, previousBasis=basis)
+		yield i, basis
 
 # returns a matrix with columns that form a basis for the ideal of the ith exterior power of V_n
-# passed the basis for the ideal and the dict of indices of subsets of the basis of V_n to save time
+# passed the basis for the ideal, and optionally a dict of indices of monomials of the ith exterior power
+# without the dict, monomials are indexed by their rank in the combinatorial number system (see Subsets.rankMask)
 # result is in sparse CSR format
-def idealBasisMatrix(n, i, idealBasis, indices):
-
-	basisMatrix = lil_matrix((len(indices), len(idealBasis)))
-
-	for j in xrange(len(idealBasis)):
-		for k in xrange(len(idealBasis[j].coeffVectorPairs)):
-			coeff, basisVector = idealBasis[j].coeffVectorPairs[k]
-			basisMatrix[indices[tuple(basisVector)], j] = coeff
+def idealBasisMatrix(n, i, idealBasis, indices=None):
+	batch = Action.ElementBatch(idealBasis, i, len(V(n)))
+	if indices is None:
+		result = batch.matrix(ss.binomial(len(V(n)), i))
+	else:
+		result = batch.matrix(len(indices), Action.indexLookup(indices, batch.dtype))
+	Instrument.gauge('idealBasisMatrix', result.shape, nnz=result.nnz, n=n, i=i)
 
-	return basisMatrix.tocsr()
+	return result
 
 # returns the image of idealBasisMatrix(n, i) under the action of perm
-# passed the basis for the ideal and the dict of indices of subsets of the basis of V_n to save time
+# passed the basis for the ideal, and optionally a dict of indices of monomials as for idealBasisMatrix
+# the basis may also be passed as an Action.ElementBatch, so that repeated calls share its arrays
 # result is in sparse CSC format
 def permActionMatrix(n, i, idealBasis, indices, perm):
-	actionMatrix = lil_matrix((len(indices), len(idealBasis)))
-
-	for j in xrange(len(idealBasis)):
-		imageVector = applyPermExtV(perm, idealBasis[j])
-		for k in xrange(len(imageVector.coeffVectorPairs)):
-			coeff, basisVector = imageVector.coeffVectorPairs[k]
-			actionMatrix[indices[tuple(basisVector)], j] = coeff
+	batch = idealBasis
+	if not isinstance(batch, Action.ElementBatch):
+		batch = Action.ElementBatch(idealBasis, i, len(V(n)))
+	if indices is None:
+		return batch.actionMatrix(inducedPermV(perm), ss.binomial(len(V(n)), i))
 
-	return actionMatrix.tocsc()
+	return batch.actionMatrix(inducedPermV(perm), len(indices), Action.indexLookup(indices, batch.dtype))
 
-# returns a dict containing the values of the permutation character on V_n
+# returns a list of the values of the permutation character on V_n, indexed by the rank of the cycle type
 def characterV(n):
 	cycleTypes = Perm.partitions(1, n)
 	charVVal = lambda x: (x.count(1) * (x.count(1) - 1)) / 2 + x.count(2)
 
-	return {tuple(x): charVVal(x) for x in cycleTypes}
+	return [charVVal(x) for x in cycleTypes]
 
-# returns a dict containing the values of the kth exterior power of the permutation character on V_n
-def characterExtV(n, k):
-	cycleTypes = Perm.partitions(1, n)
+# tables of exterior power characters already computed, keyed by n
+characterExtVTables = {}
+
+# returns a table of the values of the exterior powers of the permutation character on V_n, for k = 0, ..., K
+# row k is the list of values of the kth exterior power, indexed by the rank of the cycle type
+# computed bottom up by Newton's identity k e_k = sum_{m=1}^k (-1)^(m-1) p_m e_{k-m}, where p_m(c) is the
+# permutation character on V_n of the mth power of c, read off through the power map table
+# the rows returned are copies, so callers may modify them without corrupting the memoized table
+def characterExtVTable(n, K):
+	K = min(K, len(V(n)))
+	if n in characterExtVTables and len(characterExtVTables[n]) > K:
+		return [list(row) for row in characterExtVTables[n][:K + 1]]
 
-	if k == 0:
-		return {tuple(cycleType): 1 for cycleType in cycleTypes}
+	charV = characterV(n)
+	powerSums = [None] + [[charV[r] for r in row] for row in Perm.powerMapTable(n, K)[1:]]
 
-	if k == 1:
-		return characterV(n)
+	table = [[1] * len(charV)]
+	for k in range(1, K + 1):
+		row = [0] * len(charV)
+		for m in range(1, k + 1):
+			sign = -sgn(m)
+			row = [x + sign * p * e for x, p, e in zip(row, powerSums[m], table[k - m])]
+		table.append([x / k for x in row])
 
-	previousChars = [characterExtV(n, i) for i in range(0,k)]
-	characterExtVVal = lambda c: sum(map(lambda m: -sgn(m) * previousChars[1][tuple(Perm.powerCycleType(c, m))] * previousChars[k - m][tuple(c)], range(1,k + 1))) / k
-	return {tuple(cycleType): characterExtVVal(cycleType) for cycleType in cycleTypes}
+	characterExtVTables[n] = table
+
+	return [list(row) for row in table]
+
+# returns a list of the values of the kth exterior power of the permutation character on V_n, indexed by the rank of the cycle type
+def characterExtV(n, k):
+	if k > len(V(n)):
+		return [0] * Perm.partitionCount(1, n)
+
+	return characterExtVTable(n, k)[k]
 
 # returns the value of the the character of the ideal on a permutation
-# passed the basis for the ideal and the dict of indices of subsets of the basis of V_n to save time
-# also passed a factored version of idealBasisMatrix
-def charVal(n, i, idealBasis, indices, iBMPseudoInv, perm):
+# passed a basis for the ideal in reduced echelon form, sorted by leading monomial, as an Action.ElementBatch
+# since the leading monomial c of a basis element b appears in no other basis element, the coordinate of perm(b)
+# along b is its coefficient of c divided by that of b, which is the coefficient of perm^-1(c) in b up to sign
+# so the trace only needs one lookup per basis element, done for all of them at once
+def charVal(n, i, idealBatch, perm):
 	# if i < 2 the ideal is trivial
 	if i < 2:
 		return 0
-	
-	pAM = permActionMatrix(n, i, idealBasis, indices, perm)
-
-	# compute the trace of inv(iBM)*permActionMatrix, which is the desired character
-	# first handle case where iBMPseudoInv is 1x1
-	if iBMPseudoInv.shape[0] == 1:
-		if len(iBMPseudoInv.shape) == 1:
-			trace = iBMPseudoInv[0] * pAM[0,0]
-		else:
-			trace = iBMPseudoInv[0,0] * pAM[0,0]
-	else:
-		trace = 0
-		for j in range(pAM.shape[1]):
-			trace += iBMPseudoInv.getrow(j).dot(pAM.getcol(j))[0,0]
 
-	return trace
+	inversePerm = [0] * n
+	for j in range(n):
+		inversePerm[perm[j]] = j
+
+	return idealBatch.leadTrace(inducedPermV(inversePerm))
+
+# returns the form of a list of character values saved in checkpoints, with fractions as (numerator, denominator)
+def checkpointValues(values):
+	return [(value.numerator, value.denominator) if isinstance(value, Fraction) else value for value in values]
+
+# returns the list of character values saved in a checkpoint, or an empty list if there is none
+def valuesFromCheckpoint(state):
+	if state is None:
+		return []
+	return [Fraction(*value) if isinstance(value, tuple) else value for value in state]
+
+# returns the checkpoints of the ideal basis and of the character loop for (n, i) in a directory, or Nones
+def characterCheckpoints(n, i, checkpointDirectory):
+	return Checkpoint.checkpoint(checkpointDirectory, ('ideal', n, i)), Checkpoint.checkpoint(checkpointDirectory, ('character', n, i))
 
 # returns a list of character values for desired character on the cycle types in lexagraphical order
 # the list output is so that it plays nicely with cp.interpolateCyclePolys
-def character(n, i):
+# if checkpointDirectory is given, the elimination and the values computed so far are checkpointed there,
+# and computation resumes from any checkpoints found
+# the basis for the ideal may be passed, if it is already known; otherwise, in out-of-core mode, this is shardedCharacter
+def character(n, i, checkpointDirectory=None, idealBasis=None):
 	cycleTypes = Perm.partitions(1, n)
-	characterExtVDict = characterExtV(n, i)
+	characterExtVVals = characterExtV(n, i)
 
 	# if i < 2 the ideal is trivial
 	if i < 2:
-		return [characterExtVDict[tuple(cycleType)] for cycleType in cycleTypes]
+		return characterExtVVals
+
+	if idealBasis is None and Shards.defaultDirectory is not None:
+		return shardedCharacter(n, i)
+
+	idealCheckpoint, valuesCheckpoint = characterCheckpoints(n, i, checkpointDirectory)
+	if idealBasis is None:
+		idealBasis = cachedIdeal(n, i, idealCheckpoint)
+	idealBatch = Action.ElementBatch(idealBasis, i, len(V(n)))
+	Instrument.gauge('ideal basis', len(idealBatch), nnz=len(idealBatch.coeffs), n=n, i=i)
+
+	result = []
+	if valuesCheckpoint is not None:
+		result = valuesFromCheckpoint(valuesCheckpoint.load())[:len(cycleTypes)]
+	progress = Instrument.Progress('character', len(cycleTypes) - len(result), n=n, i=i)
+	with Instrument.stage('character', n=n, i=i):
+		for extVVal, cycleType in zip(characterExtVVals, cycleTypes)[len(result):]:
+			with Instrument.stage('charVal', detail=True, n=n, i=i, cycleType=cycleType):
+				result.append(extVVal - charVal(n, i, idealBatch, Perm.fromCycleType(n, cycleType)))
+			progress.step()
+			if valuesCheckpoint is not None and valuesCheckpoint.due():
+				valuesCheckpoint.save(checkpointValues(result))
 
-	indices = ss.indices(V(n), i)
+	return result
 
-	print('calculating ideal basis')
-	idealBasis = ideal(n, i)
+# generates (i, character(n, i)) for i = 2, ..., I, skipping the is in done, computing the ideals by gradedIdeals
+def gradedCharacters(n, I, checkpointDirectory=None, done=()):
+	with Instrument.stage('graded characters', n=n, I=I):
+		for i, idealBasis in gradedIdeals(n, I):
+			if i not in done:
+				yield i, character(n, i, checkpointDirectory, idealBasis)
+
+# generates (i, dimensions(n, i)) for i = 2, ..., I, with the exact dimensions of the ideals computed by gradedIdeals
+def gradedDimensions(n, I):
+	for i, idealBasis in gradedIdeals(n, I):
+		exterior = exteriorDimension(n, i)
+		yield i, (exterior, len(idealBasis), exterior - len(idealBasis))
+
+# out-of-core mode, used by character when Shards.defaultDirectory is set
+# the generators of the ideal are built in chunks sized to the budget and written to shards on disk, eliminated out of
+# core by Shards.rowBasis against pivots kept in shards, and the traces are summed shard by shard over memory-mapped
+# batches; every stage holds a bounded number of shards and blocks of rows at a time, so peak memory stays within the
+# budget (beyond that of the interpreter and its modules) however large the ideal is
+# complete shard sets are reused, so an interrupted run resumes from the last completed stage
+
+# returns the directory of the shard set of the basis for the ideal of the ith exterior power of V_n under directory,
+# computing it unless it is already complete
+def shardedIdeal(n, i, directory=Shards.defaultDirectory, budget=Shards.defaultBudget):
+	basisDirectory = os.path.join(directory, 'ideal-{}-{}'.format(n, i))
+	if Shards.complete(basisDirectory):
+		return basisDirectory
+
+	N = len(V(n))
+	generatorDirectory = basisDirectory + '.generators'
+	with Instrument.stage('sharded ideal basis', n=n, i=i):
+		if not Shards.complete(generatorDirectory):
+			# each monomial of a chunk has a product with each of the R_t, of a few terms
+			chunkSize = max(1, Shards.shardCapacity(budget) / (3 * ss.binomial(n, 3)))
+			generators = Instrument.counted('generators', idealGenerators(n, i, chunkSize))
+			Shards.write(generatorDirectory, i, N, generators, budget)
+		Shards.rowBasis(Shards.rows(generatorDirectory, sparsestFirst=True), basisDirectory, i, N, budget,
+			total=Shards.manifest(generatorDirectory)['rows'])
+		Shards.remove(generatorDirectory)
+
+	return basisDirectory
+
+# returns character(n, i), computed out of core from the shards of shardedIdeal
+def shardedCharacter(n, i, directory=Shards.defaultDirectory, budget=Shards.defaultBudget):
+	characterExtVVals = characterExtV(n, i)
+	if i < 2:
+		return characterExtVVals
 
-	print('calculating character')
-	iBM = idealBasisMatrix(n, i, idealBasis, indices)
-	iBMNormal = iBM.T.dot(iBM)
-	iBMPseudoInv = spsolve(iBMNormal, iBM.T, use_umfpack=False)
+	basisDirectory = shardedIdeal(n, i, directory, budget)
+	perms = [Perm.fromCycleType(n, cycleType) for cycleType in Perm.partitions(1, n)]
+	idealVals = [0] * len(perms)
+	progress = Instrument.Progress('sharded character', len(Shards.manifest(basisDirectory)['shards']), n=n, i=i)
+	with Instrument.stage('sharded character', n=n, i=i):
+		for batch in Shards.batches(basisDirectory):
+			idealVals = [value + charVal(n, i, batch, perm) for value, perm in zip(idealVals, perms)]
+			progress.step()
 
-	return [characterExtVDict[tuple(cycleType)] - charVal(n, i, idealBasis, indices, iBMPseudoInv, Perm.fromCycleType(n, cycleType)) for cycleType in cycleTypes]
+	return [extVVal - idealVal for extVVal, idealVal in zip(characterExtVVals, idealVals)]
 
 # returns a dictionary from cycle types (as tuples) to character values for the desired character
 def characterDict(n, i):
 	return dict(zip(map(tuple, Perm.partitions(1, n)), character(n, i)))
 
-# stores lists of character values in a given file for use later
-# specifically, the characters on V_m through V_n
-def characterDump(m, n, i, filename):
-	output = open(filename, 'a')
-	for k in xrange(m, n + 1):
-		characterValues = (k, i), character(k, i)
-		print(characterValues)
-		pickle.dump(characterValues, output)
-
-	output.close()
+# state shared with the worker processes of parallelCharacters
+# workers are forked after it is filled in, so they inherit it instead of having it pickled with every task
+sharedIdealBases = {}
+
+# worker for parallelCharacters, computes the ideal basis for one k
+def idealTask(args):
+	k, i, checkpointDirectory = args
+	return cachedIdeal(k, i, characterCheckpoints(k, i, checkpointDirectory)[0])
+
+# worker for parallelCharacters, computes the values of the ideal character on a slice of the cycle types of S_k
+def charValTask(args):
+	k, i, start, stop = args
+	return [charVal(k, i, sharedIdealBases[k], Perm.fromCycleType(k, cycleType)) for cycleType in Perm.partitions(1, k)[start:stop]]
+
+# generates (k, character(k, i)) for k = m, ..., n in order, using a pool of processes, skipping the ks in done
+# the ideal bases are computed in parallel over k, then the traces in parallel over k and slices of the cycle types
+# eliminations are checkpointed in checkpointDirectory, if given
+def parallelCharacters(m, n, i, processes, checkpointDirectory=None, done=()):
+	from multiprocessing import Pool
+
+	ks = [k for k in range(max(m, 0), n + 1) if k not in done]
+	if i >= 2:
+		with Instrument.stage('ideal bases', m=m, n=n, i=i):
+			pool = Pool(processes)
+			try:
+				bases = pool.map(idealTask, [(k, i, checkpointDirectory) for k in ks])
+			except:
+				pool.terminate()
+				raise
+			pool.close()
+			pool.join()
+		sharedIdealBases.update((k, Action.ElementBatch(basis, i, len(V(k)))) for k, basis in zip(ks, bases))
+
+	tasks = []
+	for k in ks:
+		numCycleTypes = Perm.partitionCount(1, k)
+		chunkSize = max(1, numCycleTypes / (4 * processes))
+		tasks.extend([(k, i, start, start + chunkSize) for start in xrange(0, numCycleTypes, chunkSize)])
+
+	progress = Instrument.Progress('characters', sum(Perm.partitionCount(1, k) for k in ks), m=m, n=n, i=i)
+	pool = Pool(processes)
+	try:
+		results = iter(pool.imap(charValTask, tasks)) if i >= 2 else None
+		for k in ks:
+			characterExtVVals = characterExtV(k, i)
+			idealVals = []
+			if i >= 2:
+				while len(idealVals) < len(characterExtVVals):
+					values = next(results)
+					idealVals.extend(values)
+					progress.step(len(values))
+			else:
+				idealVals = [0] * len(characterExtVVals)
+			yield k, [extVVal - idealVal for extVVal, idealVal in zip(characterExtVVals, idealVals)]
+	finally:
+		pool.close()
+		pool.join()
+		sharedIdealBases.clear()
+
+# stores lists of character values in a results store for use later
+# specifically, the characters on V_m through V_n, skipping those already stored, so an interrupted dump can be rerun
+# work in progress is checkpointed in the directory filename.checkpoints, and the checkpoints of a character are
+# removed once it is stored
+# if processes > 1, the characters are computed on a pool of that many processes, and written in the same order
+def characterDump(m, n, i, filename, processes=1):
+	store = Results.ResultsStore(filename)
+	checkpointDirectory = filename + '.checkpoints'
+	done = set(k for k in xrange(m, n + 1) if store.get(k, i) is not None)
+	if processes > 1:
+		characters = parallelCharacters(m, n, i, processes, checkpointDirectory, done)
+	else:
+		characters = ((k, character(k, i, checkpointDirectory)) for k in xrange(m, n + 1) if k not in done)
+
+	with Instrument.stage('character dump', m=m, n=n, i=i):
+		for k, values in characters:
+			print(((k, i), values))
+			store.append(k, i, values)
+			for checkpoint in characterCheckpoints(k, i, checkpointDirectory):
+				checkpoint.remove()
+
+# stores the characters on V_m through V_n for i = 2, ..., I in a results store, as for characterDump
+# the characters for each V_k are computed by gradedCharacters, so the sweep over i costs about as much as the top degree
+def characterSweep(m, n, I, filename):
+	store = Results.ResultsStore(filename)
+	checkpointDirectory = filename + '.checkpoints'
+	with Instrument.stage('character sweep', m=m, n=n, I=I):
+		for k in xrange(m, n + 1):
+			done = set(i for i in xrange(2, I + 1) if store.get(k, i) is not None)
+			if len(done) == I - 1:
+				continue
+			for i, values in gradedCharacters(k, I, checkpointDirectory, done):
+				print(((k, i), values))
+				store.append(k, i, values)
+				characterCheckpoints(k, i, checkpointDirectory)[1].remove()
+
+# prints the dimensions of the exterior power, the ideal and the quotient for V_m through V_n and i = 2, ..., I,
+# a quick screen of a grid before computing full characters
+# by default the dimensions for each V_k come from one pass of gradedDimensions, which costs about as much as the top
+# degree; if modular is set, each is found separately by idealDimension, which holds less in memory
+def dimensionGrid(m, n, I, modular=False):
+	with Instrument.stage('dimension grid', m=m, n=n, I=I):
+		for k in xrange(m, n + 1):
+			if modular:
+				grid = ((i, dimensions(k, i)) for i in xrange(2, I + 1))
+			else:
+				grid = gradedDimensions(k, I)
+			for i, (exterior, idealDim, quotient) in grid:
+				print('n={} i={} exterior={} ideal={} quotient={}'.format(k, i, exterior, idealDim, quotient))
+
+# main function, runs characterDump, characterSweep or dimensionGrid on the command line arguments args (without the
+# program name), showing progress on the console
+def main(args):
+	Instrument.listeners.append(Instrument.consoleProgress)
+	if args[0] == 'sweep':
+		characterSweep(int(args[1]), int(args[2]), int(args[3]), args[4])
+	elif args[0] == 'dimensions':
+		dimensionGrid(int(args[1]), int(args[2]), int(args[3]), args[4:5] == ['modular'])
+	else:
+		characterDump(int(args[0]), int(args[1]), int(args[2]), args[3], *map(int, args[4:5]))
 
-# main function, runs characterDump
 if __name__ == '__main__':
-	characterDump(int(argv[1]), int(argv[2]), int(argv[3]), argv[4])
+	main(argv[1:])
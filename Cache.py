@@ -0,0 +1,150 @@
+# Cache module
+# a persistent, content-addressed cache of computed arrays on disk
+# entries are uncompressed .npz files (no pickled objects) named by a hash of a versioned key
+# each entry carries a checksum of its arrays, and the cache is kept under a size bound by evicting least recently used entries
+
+import os
+import hashlib
+import tempfile
+import Lazy
+import ExteriorAlg as ea
+
+numpy = Lazy.module('numpy')
+
+# bump whenever the meaning or layout of cached arrays changes, which invalidates all old entries
+formatVersion = 1
+
+# cache location and size bound, overridable through the environment (an empty directory disables caching)
+defaultDirectory = os.environ.get('BONUS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'bonus'))
+defaultMaxBytes = int(os.environ.get('BONUS_CACHE_MAX_BYTES', 2 ** 30))
+
+# helper functions
+
+# returns the file name of the entry for a key, which is a tuple of strings and integers
+def entryName(key):
+	versionedKey = repr((formatVersion,) + tuple(key))
+	return hashlib.sha256(versionedKey).hexdigest() + '.npz'
+
+# returns a checksum of a dict of arrays, covering names, dtypes, shapes and contents
+def checksum(arrays):
+	digest = hashlib.sha256()
+	for name in sorted(arrays):
+		array = numpy.ascontiguousarray(arrays[name])
+		digest.update('{}:{}:{};'.format(name, array.dtype.str, array.shape))
+		digest.update(array.tobytes())
+
+	return digest.hexdigest()
+
+# class Cache
+# a directory of cache entries
+
+class Cache:
+	def __init__(self, directory=defaultDirectory, maxBytes=defaultMaxBytes):
+		self.directory = directory
+		self.maxBytes = maxBytes
+
+	# returns the dict of arrays stored under key, or None if there is no valid entry
+	# entries failing their integrity check are removed
+	def load(self, key):
+		path = os.path.join(self.directory, entryName(key))
+		try:
+			entry = numpy.load(path, allow_pickle=False)
+			arrays = {name: entry[name] for name in entry.files}
+			entry.close()
+		except (IOError, OSError):
+			return None
+		except Exception:
+			# unreadable entry, e.g. a truncated or corrupted file
+			self.remove(key)
+			return None
+
+		storedChecksum = str(arrays.pop('checksum', ''))
+		if storedChecksum != checksum(arrays):
+			self.remove(key)
+			return None
+
+		# mark entry as recently used
+		try:
+			os.utime(path, None)
+		except OSError:
+			pass
+
+		return arrays
+
+	# stores a dict of arrays under key, atomically, then evicts entries until the cache fits in maxBytes
+	def store(self, key, arrays):
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+
+		arrays = dict(arrays)
+		arrays['checksum'] = numpy.array(checksum(arrays))
+		fd, tempPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as tempFile:
+				numpy.savez(tempFile, **arrays)
+			os.rename(tempPath, os.path.join(self.directory, entryName(key)))
+		except:
+			os.remove(tempPath)
+			raise
+
+		self.evict()
+
+	def remove(self, key):
+		try:
+			os.remove(os.path.join(self.directory, entryName(key)))
+		except OSError:
+			pass
+
+	# removes least recently used entries until the total size is at most maxBytes
+	# other processes may evict at the same time, so entries can vanish between listing and removing them
+	def evict(self):
+		entries = []
+		for name in os.listdir(self.directory):
+			if name.endswith('.npz'):
+				try:
+					stat = os.stat(os.path.join(self.directory, name))
+				except OSError:
+					continue
+				entries.append((stat.st_mtime, stat.st_size, name))
+
+		entries.sort()
+		total = sum(size for _, size, _ in entries)
+		for _, size, name in entries:
+			if total <= self.maxBytes:
+				break
+			try:
+				os.remove(os.path.join(self.directory, name))
+			except OSError:
+				# already removed by another process, so it no longer counts either way
+				pass
+			total -= size
+
+# conversion between lists of elements of the kth exterior power and CSR arrays
+# row j of the CSR arrays holds the terms of the jth element, each monomial stored as its k sorted basis indices
+
+# returns the CSR arrays of a list of elements of the kth exterior power, or None if a coefficient does not fit in int64
+def elementsToArrays(elements, k):
+	indptr = numpy.zeros(len(elements) + 1, dtype=numpy.int64)
+	for j in xrange(len(elements)):
+		indptr[j + 1] = indptr[j] + len(elements[j].monomials)
+
+	monomials = numpy.empty((indptr[-1], k), dtype=numpy.int16)
+	coeffs = numpy.empty(indptr[-1], dtype=numpy.int64)
+	bound = 2 ** 63
+	position = 0
+	for elt in elements:
+		for coeff, mask in zip(elt.coeffs, elt.monomials):
+			if not -bound <= coeff < bound or int(coeff) != coeff:
+				return None
+			monomials[position] = ea.basisIndices(mask)
+			coeffs[position] = coeff
+			position += 1
+
+	return {'indptr': indptr, 'monomials': monomials, 'coeffs': coeffs}
+
+# returns the list of elements stored in CSR arrays
+def elementsFromArrays(arrays):
+	indptr, monomials, coeffs = arrays['indptr'].tolist(), arrays['monomials'].tolist(), arrays['coeffs'].tolist()
+	masks = map(ea.monomial, monomials)
+
+	return [ea.Element(coeffs[indptr[j]:indptr[j + 1]], masks[indptr[j]:indptr[j + 1]]) for j in xrange(len(indptr) - 1)]
@@ -0,0 +1,88 @@
+# Checkpoint module
+# periodic checkpoints of long computations, so that a restarted run resumes where it stopped
+# a checkpoint file holds one python value built from integers, strings, lists, tuples and dicts, in the compact
+# binary marshal format, after a header with a magic string and a checksum of the data
+# writes go to a temporary file which is renamed over the checkpoint, so a crash leaves the previous checkpoint intact,
+# and checkpoints failing their checksum are ignored
+
+import os
+import marshal
+import hashlib
+import tempfile
+import time
+import Instrument
+
+magic = 'BCK1'
+
+# minimum time between saves of a checkpoint in seconds, overridable through the environment
+defaultInterval = float(os.environ.get('BONUS_CHECKPOINT_INTERVAL', 60))
+
+# helper functions
+
+# returns the path of the checkpoint for a key, which is a tuple of strings and integers, in a directory
+def checkpointPath(directory, key):
+	return os.path.join(directory, '-'.join(str(part) for part in key) + '.ckpt')
+
+# class Checkpoint
+# a checkpoint file, saved at most once every interval seconds when the computation asks whether it is due
+
+class Checkpoint:
+	def __init__(self, path, interval=defaultInterval):
+		self.path = path
+		self.interval = interval
+		self.lastSave = time.time()
+
+	# returns whether enough time has passed since the last save to save again
+	def due(self):
+		return time.time() - self.lastSave >= self.interval
+
+	# returns the value saved in the checkpoint, or None if there is no valid checkpoint
+	def load(self):
+		try:
+			with open(self.path, 'rb') as checkpointFile:
+				data = checkpointFile.read()
+		except IOError:
+			return None
+
+		header = len(magic) + hashlib.sha256().digest_size
+		if data[:len(magic)] != magic or hashlib.sha256(data[header:]).digest() != data[len(magic):header]:
+			return None
+		try:
+			return marshal.loads(data[header:])
+		except (ValueError, EOFError, TypeError):
+			return None
+
+	# saves a value in the checkpoint, atomically
+	def save(self, value):
+		directory = os.path.dirname(self.path) or '.'
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+		data = marshal.dumps(value)
+		fd, tempPath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as tempFile:
+				tempFile.write(magic + hashlib.sha256(data).digest() + data)
+				tempFile.flush()
+				os.fsync(tempFile.fileno())
+			os.rename(tempPath, self.path)
+		except:
+			os.remove(tempPath)
+			raise
+
+		self.lastSave = time.time()
+		Instrument.count('checkpoints')
+
+	# removes the checkpoint, once the computation it belongs to is finished
+	def remove(self):
+		try:
+			os.remove(self.path)
+		except OSError:
+			pass
+
+# returns the checkpoint for a key in a directory, or None if directory is None (no checkpointing)
+def checkpoint(directory, key, interval=defaultInterval):
+	if directory is None:
+		return None
+
+	return Checkpoint(checkpointPath(directory, key), interval)
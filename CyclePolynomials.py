@@ -2,12 +2,28 @@
 # implements the CyclePoly class and related methods	
 
 import Perm
-from numpy import *
+import Elimination
+from fractions import Fraction
+import numpy
 from numpy.linalg import lstsq
 
-# zero cutoff for coefficients of a CyclePoly
+# zero cutoff for floating point coefficients of a CyclePoly (exact coefficients are compared with zero)
 epsilon = .001
 
+# returns whether a coefficient of a CyclePoly is nonzero
+def isNonzero(coeff):
+	if isinstance(coeff, (int, long, Fraction)):
+		return coeff != 0
+	return abs(coeff) > epsilon
+
+# returns the string of a coefficient of a CyclePoly, with fractions in parentheses so they read unambiguously
+def coeffString(coeff):
+	if isinstance(coeff, Fraction):
+		if coeff.denominator == 1:
+			return str(coeff.numerator)
+		return '({})'.format(coeff)
+	return str(coeff)
+
 # returns all monomials of degree d in r cycle variables
 # a monomial is represented as a list of integers, with the ith entry being the degree of the (i+1)st cycle variable
 # this function is shit, but it's not a bottleneck so w/e
@@ -50,18 +66,99 @@ def evalMonomial(monomial, cycleType):
 
 	return result
 
+# returns the matrix of cycle counts of a list of cycle types (as sorted lists)
+# entry (j, k) is the number of (k+1)-cycles of the jth cycle type, for k < r
+# the counts are the multiplicity vectors of the cycle types, gathered by rank from Perm.multiplicityTable
+def cycleCountMatrix(points, r, dtype=numpy.int64):
+	counts = numpy.zeros((len(points), r), dtype=dtype)
+	rows = {}
+	for j in range(len(points)):
+		rows.setdefault(sum(points[j]), []).append(j)
+	for n, indices in rows.iteritems():
+		width = min(r, n)
+		if width == 0:
+			continue
+		table = numpy.frombuffer(Perm.multiplicityTable(n), dtype=numpy.uint16).reshape(-1, n)
+		ranks = [Perm.partitionRank(points[j]) for j in indices]
+		counts[indices, :width] = table[ranks, :width].astype(dtype)
+
+	return counts
+
+# class DesignMatrix
+# evaluates monomials on a fixed list of cycle types, column by column
+# the cycle counts and their powers are tabulated once, and columns are cached by monomial,
+# so a matrix for a subset of previously used terms (as when refining) costs no new evaluations
+# dtype may be float64, longdouble, or object for exact integer entries
+
+class DesignMatrix:
+	def __init__(self, points, dtype=numpy.float64):
+		self.points = points
+		self.dtype = dtype
+		self.counts = cycleCountMatrix(points, 0, dtype)
+		self.powers = {}
+		self.columns = {}
+
+	# returns the column of values of a monomial on the cycle types
+	def column(self, monomial):
+		key = tuple(monomial)
+		if key not in self.columns:
+			if len(monomial) > self.counts.shape[1]:
+				self.counts = cycleCountMatrix(self.points, len(monomial), self.dtype)
+			result = numpy.ones(len(self.points), dtype=self.dtype)
+			for k in range(len(monomial)):
+				if monomial[k] != 0:
+					if (k, monomial[k]) not in self.powers:
+						self.powers[k, monomial[k]] = self.counts[:, k] ** monomial[k]
+					result = result * self.powers[k, monomial[k]]
+			self.columns[key] = result
+
+		return self.columns[key]
+
+	# returns the matrix whose (j, k) entry is the value of the kth term on the jth cycle type
+	def matrix(self, terms):
+		if not terms:
+			return numpy.empty((len(self.points), 0), dtype=self.dtype)
+
+		return numpy.column_stack([self.column(term) for term in terms])
+
+# design matrices for the cycle types of S_x through S_n, keyed by (x, n, dtype), kept for reuse by repeated interpolations
+designMatrices = {}
+
+# returns the design matrix for the cycle types of S_x through S_n (sorted by S_i, then lexigraphically)
+# dtype object gives exact integer entries
+def designMatrix(x, n, dtype=numpy.float64):
+	if (x, n, dtype) not in designMatrices:
+		points = []
+		for k in range(x, n + 1):
+			points.extend(Perm.partitions(1, k))
+		designMatrices[x, n, dtype] = DesignMatrix(points, dtype)
+
+	return designMatrices[x, n, dtype]
+
+# returns A^T B exactly, as an object array, for integer arrays A and B (int64 or object)
+# uses int64 arithmetic when the entries are small enough that the sums of products cannot overflow
+def exactTransposeProduct(A, B):
+	if A.size == 0 or B.size == 0:
+		return numpy.zeros((A.shape[1], B.shape[1]), dtype=object)
+	if int(abs(A).max()) * int(abs(B).max()) * A.shape[0] < 2 ** 63:
+		return A.astype(numpy.int64).T.dot(B.astype(numpy.int64)).astype(object)
+
+	return A.astype(object).T.dot(B.astype(object))
+
 # defines cycle polynomials as a list of monomials and a list of coefficients
+# an interpolated cycle polynomial also records the error of the interpolation
 class CyclePoly:
-	def __init__(self, terms, coefficients):
+	def __init__(self, terms, coefficients, error=None):
 		self.terms = terms
 		self.coefficients = coefficients
+		self.error = error
 
 	def __str__(self):
 		result = ''
 		for i in range(len(self.terms)):
 			coeff = self.coefficients[i]
-			if abs(coeff) > epsilon:
-				result += str(coeff)
+			if isNonzero(coeff):
+				result += coeffString(coeff)
 				j = 1
 				for degree in self.terms[i]:
 					if degree != 0:
@@ -76,16 +173,40 @@ class CyclePoly:
 	def nonzeroTerms(self):
 		result = []
 		for i in range(len(self.terms)):
-			if abs(self.coefficients[i]) > epsilon:
+			if isNonzero(self.coefficients[i]):
 				result.append(self.terms[i])
 
 		return result
 
+# returns the exact least squares cycle polynomial with the given terms, for values on the rows of an exact design matrix
+# the coefficients are fractions, certified by Elimination.solveDense, and the error printed is the exact sum of squared residuals
+# raises ValueError if the values do not determine the coefficients, listing the undetermined terms
+def exactInterpolate(A, functionVals, terms):
+	exactA = A
+	if A.size and abs(A).max() < 2 ** 62:
+		A = A.astype(numpy.int64)
+
+	coefficients, pivots, consistent = Elimination.solveDense(A, functionVals)
+	if len(pivots) < len(terms):
+		free = [terms[k] for k in range(len(terms)) if k not in pivots]
+		raise ValueError('underdetermined interpolation, no unique coefficients for the terms {}'.format(free))
+
+	lstsqError = 0
+	if not consistent:
+		# an object product with no terms is None rather than zeros
+		residuals = numpy.array(functionVals, dtype=object)
+		if terms:
+			residuals = residuals - exactA.dot(numpy.array(coefficients, dtype=object))
+		lstsqError = residuals.dot(residuals)
+
+	print('Error: {}'.format(lstsqError))
+
+	return CyclePoly(terms, coefficients, lstsqError)
+
 # given a list of values of a function f on the cycle types of S_n (sorted lexigraphically)
 # returns the best degree d cycle polynomial interpolation of f in r cycle variables
-def interpolateCyclePoly(n, functionVals, d, r):
-	points = Perm.partitions(1, n)
-
+# the interpolation is exact (see exactInterpolate) unless exact is False, in which case it is a floating point least squares fit
+def interpolateCyclePoly(n, functionVals, d, r, exact=True):
 	# all monomials of degree at most d
 	terms = []
 	for i in range(d+1):
@@ -94,35 +215,123 @@ def interpolateCyclePoly(n, functionVals, d, r):
 	# let m_i be the monomials of degree at most d in r cycle variables, sorted lexigraphically
 	# let c_i be the cycle types of S_n, sorted lexigraphically
 	# A * x returns the value of sum_i x_im_i(c_j)
-	A = empty( (len(points), len(terms)) )
-	for i in range(len(points)):
-		for j in range(len(terms)):
-			A[i,j] = evalMonomial(terms[j], points[i])
+	if exact:
+		return exactInterpolate(designMatrix(n, n, object).matrix(terms), functionVals, terms)
+	A = designMatrix(n, n).matrix(terms)
 
 	coefficients, lstsqError = lstsq(A, functionVals)[:2]
 
 	print('Error: {}'.format(lstsqError))
 
-	return CyclePoly(terms, coefficients)
+	return CyclePoly(terms, coefficients, lstsqError)
 
 # better version of interpolateCyclePolynomial for functions which are defined on all S_i
 # given the list of values of a function f on the cycles types of S_x through S_n (sorted by S_i, then lexigraphically)
 # returns the best cycle polynomials interpolation (using the given terms) of f
-# works by minimizing the error across S_x through S_n
-def multiInterpolate(x, n, functionVals, terms):
-	points = []
-	for k in range(x,n+1):
-		points.extend(Perm.partitions(1, k))
-
+# works by minimizing the error across S_x through S_n, exactly unless exact is False
+def multiInterpolate(x, n, functionVals, terms, exact=True):
 	# like A from interpolateCyclePolynomials, but A * x returns the concatenation of all values sum_i x_im_i(c_j)
-	A = empty( (len(points), len(terms)) )
-	for i in range(len(points)):
-		for j in range(len(terms)):
-			A[i,j] = evalMonomial(terms[j], points[i])
+	if exact:
+		return exactInterpolate(designMatrix(x, n, object).matrix(terms), functionVals, terms)
+	A = designMatrix(x, n).matrix(terms)
 
 	coefficients, lstsqError = lstsq(A, functionVals)[:2]
 
 	print('Error: {}'.format(lstsqError))
 
-	return CyclePoly(terms, coefficients)
+	return CyclePoly(terms, coefficients, lstsqError)
+
+
+# class IncrementalFit
+# an exact least squares fit of a cycle polynomial, kept as the normal equations of the data seen so far
+# data arrives in batches of cycle types and values (e.g. the character on S_n as it is computed), which update the
+# normal equations without revisiting earlier batches, and terms can be added or removed at any time
+# the design matrix of each batch is kept, with its column cache, so adding a term only evaluates the new column
+
+class IncrementalFit:
+	def __init__(self, terms):
+		self.terms = [list(term) for term in terms]
+		self.characters = []
+		self.designs = []
+		self.values = []
+		self.gram = numpy.zeros((len(self.terms), len(self.terms)), dtype=object)
+		self.moments = numpy.zeros(len(self.terms), dtype=object)
+		self.sumSquares = 0
+
+	# returns the number of values fitted so far
+	def __len__(self):
+		return sum(len(values) for values in self.values)
+
+	# adds a batch of cycle types and the values of the function on them
+	def addRows(self, points, values):
+		design = DesignMatrix(points, object)
+		A = design.matrix(self.terms)
+		b = numpy.array(values, dtype=object)
+		self.designs.append(design)
+		self.values.append(b)
+
+		self.gram = self.gram + exactTransposeProduct(A, A)
+		self.moments = self.moments + A.T.dot(b)
+		self.sumSquares += b.dot(b)
+
+	# adds the values of the function on the cycle types of S_n (sorted lexigraphically)
+	def addCharacter(self, n, values):
+		self.addRows(Perm.partitions(1, n), values)
+		self.characters.append(n)
+
+	# adds terms to the fit, ignoring those already present
+	def addTerms(self, terms):
+		newTerms = []
+		for term in terms:
+			if list(term) not in self.terms and list(term) not in newTerms:
+				newTerms.append(list(term))
+		if not newTerms:
+			return
+
+		cross = numpy.zeros((len(self.terms), len(newTerms)), dtype=object)
+		newGram = numpy.zeros((len(newTerms), len(newTerms)), dtype=object)
+		newMoments = numpy.zeros(len(newTerms), dtype=object)
+		for design, b in zip(self.designs, self.values):
+			A, B = design.matrix(self.terms), design.matrix(newTerms)
+			cross = cross + exactTransposeProduct(A, B)
+			newGram = newGram + exactTransposeProduct(B, B)
+			newMoments = newMoments + B.T.dot(b)
+
+		self.gram = numpy.vstack([numpy.hstack([self.gram, cross]), numpy.hstack([cross.T, newGram])])
+		self.moments = numpy.concatenate([self.moments, newMoments])
+		self.terms.extend(newTerms)
+
+	# removes terms from the fit, ignoring those not present
+	def removeTerms(self, terms):
+		removed = [list(term) for term in terms]
+		keep = [k for k in range(len(self.terms)) if self.terms[k] not in removed]
+
+		self.gram = self.gram[numpy.ix_(keep, keep)]
+		self.moments = self.moments[keep]
+		self.terms = [self.terms[k] for k in keep]
+
+	# returns the exact least squares cycle polynomial of the data so far, recording the exact sum of squared residuals
+	# raises ValueError if the data does not determine the coefficients, listing the undetermined terms
+	def solve(self):
+		# with no terms (e.g. all refined away from a zero function) the fit is the zero polynomial
+		if not self.terms:
+			return CyclePoly([], [], self.sumSquares)
+
+		coefficients, pivots = Elimination.solveNormal(self.gram, self.moments)
+		if len(pivots) < len(self.terms):
+			free = [self.terms[k] for k in range(len(self.terms)) if k not in pivots]
+			raise ValueError('underdetermined interpolation, no unique coefficients for the terms {}'.format(free))
+
+		x = numpy.array(coefficients, dtype=object)
+		error = self.sumSquares - 2 * x.dot(self.moments) + x.dot(self.gram.dot(x))
+
+		return CyclePoly(list(self.terms), coefficients, error)
+
+	# refines the fit by removing its zero terms until the support stops changing, returning the refined polynomial
+	def refine(self):
+		soln = self.solve()
+		while soln.nonzeroTerms() != soln.terms:
+			self.removeTerms([term for term in soln.terms if term not in soln.nonzeroTerms()])
+			soln = self.solve()
 
+		return soln
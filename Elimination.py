@@ -0,0 +1,473 @@
+# Elimination module
+# exact sparse gaussian elimination, either over the rationals or over GF(p)
+# a row is a dict from column keys to coefficients, where the column keys are any sortable hashable objects
+# rows are modified in place rather than copied
+# also implements exact solving of dense integer linear systems, by elimination modulo several primes,
+# chinese remaindering and rational reconstruction
+
+import Lazy
+import Instrument
+from fractions import Fraction, gcd
+from heapq import heapify, heappush, heappop
+
+numpy = Lazy.module('numpy')
+
+# default modulus for elimination over GF(p), the largest prime below 2^31
+defaultModulus = 2147483647
+
+# helper functions
+
+# returns the inverse of a modulo the prime p
+def inverseMod(a, p):
+	return pow(a % p, p - 2, p)
+
+# divides a row of integers by the gcd of its entries, making the leading entry positive
+def makePrimitive(row, lead):
+	content = 0
+	for coeff in row.itervalues():
+		content = gcd(content, coeff)
+		if content == 1:
+			break
+
+	if row[lead] < 0:
+		content = -abs(content)
+	else:
+		content = abs(content)
+
+	if content != 1:
+		for col in row:
+			row[col] /= content
+
+# returns the integer square root of a nonnegative integer, exact for integers too large for floats
+def isqrt(a):
+	if a < 2:
+		return a
+	x = 1 << ((a.bit_length() + 1) / 2)
+	while True:
+		y = (x + a / x) / 2
+		if y >= x:
+			return x
+		x = y
+
+# returns the unique fraction a/b with |a|, |b| <= sqrt(p/2) congruent to x modulo p, or None if there is none
+# p need not be prime, as long as b is invertible modulo p
+# works by the half extended euclidean algorithm
+def rationalReconstruct(x, p):
+	bound = isqrt(p / 2)
+	r0, r1 = p, x % p
+	s0, s1 = 0, 1
+	while r1 > bound:
+		q = r0 // r1
+		r0, r1 = r1, r0 - q * r1
+		s0, s1 = s1, s0 - q * s1
+
+	if s1 == 0 or abs(s1) > bound:
+		return None
+
+	return Fraction(r1, s1)
+
+# class Eliminator
+# maintains a reduced spanning set of the rows inserted so far, indexed by the leading column of each row
+# over the rationals, rows are kept as primitive integer vectors and eliminated fraction-free
+# over GF(p), rows are kept normalized to have leading coefficient 1
+# nnz is the total number of nonzero entries of the pivot rows, which measures fill-in
+# pivots, if given, is a mapping from leading columns to pivot rows to reduce against instead of a dict, supporting in
+# and [] (such as Shards.ShardPivots), in which case nnz only counts the rows inserted
+
+class Eliminator:
+	def __init__(self, modulus=None, pivots=None):
+		self.modulus = modulus
+		self.pivots = {} if pivots is None else pivots
+		self.nnz = 0
+
+	def __len__(self):
+		return len(self.pivots)
+
+	# reduces a row against the current pivots, modifying it in place
+	# eliminates pivot columns in increasing order, which terminates since subtracting the pivot with leading column c
+	# only introduces columns greater than c
+	def reduce(self, row):
+		pivots = self.pivots
+		p = self.modulus
+		heap = [col for col in row if col in pivots]
+		heapify(heap)
+		while heap:
+			col = heappop(heap)
+			# skip duplicates and columns that have already cancelled
+			while heap and heap[0] == col:
+				heappop(heap)
+			a = row.get(col)
+			if not a:
+				continue
+
+			pivot = pivots[col]
+			if p is not None:
+				for c, v in pivot.iteritems():
+					newCoeff = (row.get(c, 0) - a * v) % p
+					if newCoeff:
+						if c not in row and c in pivots:
+							heappush(heap, c)
+						row[c] = newCoeff
+					else:
+						row.pop(c, None)
+			else:
+				b = pivot[col]
+				# fraction-free step row = b * row - a * pivot, which is just a signed subtraction when b = +-1
+				if b == 1 or b == -1:
+					a *= b
+				else:
+					g = gcd(a, b)
+					a, b = a / g, b / g
+					for c in row:
+						row[c] *= b
+				for c, v in pivot.iteritems():
+					newCoeff = row.get(c, 0) - a * v
+					if newCoeff:
+						if c not in row and c in pivots:
+							heappush(heap, c)
+						row[c] = newCoeff
+					else:
+						row.pop(c, None)
+
+		return row
+
+	# reduces a row and, if it is not in the span of the pivots, adds it as a new pivot
+	# returns True if the row was added
+	def insert(self, row):
+		self.reduce(row)
+		if not row:
+			return False
+
+		lead = min(row)
+		if self.modulus is not None:
+			inv = inverseMod(row[lead], self.modulus)
+			if inv != 1:
+				for col in row:
+					row[col] = row[col] * inv % self.modulus
+		else:
+			makePrimitive(row, lead)
+
+		self.pivots[lead] = row
+		self.nnz += len(row)
+
+		return True
+
+	# back-substitutes so that every pivot column appears in exactly one row (reduced row echelon form)
+	# works from the last pivot to the first, so each row only needs one pass against already reduced rows
+	def backSubstitute(self):
+		pivots = self.pivots
+		p = self.modulus
+		for lead in sorted(pivots, reverse=True):
+			row = pivots[lead]
+			for col in [c for c in row if c != lead and c in pivots]:
+				a = row.get(col)
+				if not a:
+					continue
+				pivot = pivots[col]
+				if p is not None:
+					for c, v in pivot.iteritems():
+						newCoeff = (row.get(c, 0) - a * v) % p
+						if newCoeff:
+							row[c] = newCoeff
+						else:
+							row.pop(c, None)
+				else:
+					b = pivot[col]
+					g = gcd(a, b)
+					a, b = a / g, b / g
+					if b != 1:
+						for c in row:
+							row[c] *= b
+					for c, v in pivot.iteritems():
+						newCoeff = row.get(c, 0) - a * v
+						if newCoeff:
+							row[c] = newCoeff
+						else:
+							row.pop(c, None)
+			if p is None:
+				makePrimitive(row, lead)
+
+		self.nnz = sum(len(row) for row in pivots.itervalues())
+
+	# returns the pivot rows sorted by leading column, in reduced row echelon form if reduced is set
+	# over GF(p), the rows are always put in reduced row echelon form and their entries lifted to fractions
+	# by rational reconstruction, which is exact as long as the true entries have small enough numerators and denominators
+	def basis(self, reduced=False):
+		if self.modulus is None:
+			if reduced:
+				self.backSubstitute()
+			return [self.pivots[lead] for lead in sorted(self.pivots)]
+
+		self.backSubstitute()
+		result = []
+		for lead in sorted(self.pivots):
+			row = {}
+			for col, coeff in self.pivots[lead].iteritems():
+				value = rationalReconstruct(coeff, self.modulus)
+				if value is None:
+					raise ArithmeticError('rational reconstruction failed, try a larger modulus')
+				row[col] = value
+			result.append(row)
+
+		return result
+
+# generates rows sparsest first, within consecutive buffers of bufferSize rows, or among all rows if bufferSize is None
+def markowitzOrder(rows, bufferSize=None):
+	if bufferSize is None:
+		for row in sorted(rows, key=len):
+			yield row
+		return
+
+	if bufferSize == 1:
+		for row in rows:
+			yield row
+		return
+
+	buffer = []
+	for row in rows:
+		buffer.append(row)
+		if len(buffer) == bufferSize:
+			buffer.sort(key=len)
+			for bufferedRow in buffer:
+				yield bufferedRow
+			buffer = []
+
+	buffer.sort(key=len)
+	for bufferedRow in buffer:
+		yield bufferedRow
+
+# returns a basis for the span of rows, as a list of rows sorted by leading column
+# rows may be any iterable, and are inserted in Markowitz order, sparsest first, which keeps the fill-in of the pivots low
+# if bufferSize is given, rows are only ordered within buffers of that size, so they are consumed as a stream
+# the rows passed in are modified
+# instrumented as the stage 'elimination', counting rows and pivots and reporting progress with the rank and fill-in
+# if a checkpoint (see Checkpoint) is given, the pivots and the number of rows inserted are saved to it periodically,
+# and elimination resumes from it, skipping the rows already inserted, which assumes the rows come in the same order
+# (column keys and coefficients must be integers for the pivots to be saved)
+# total is the number of rows, or an upper bound on it, if known, which gives the progress reports an ETA
+def rowBasis(rows, modulus=None, reduced=False, bufferSize=None, checkpoint=None, total=None):
+	eliminator = Eliminator(modulus)
+	position = 0
+	if checkpoint is not None:
+		state = checkpoint.load()
+		if state is not None and state['modulus'] == modulus:
+			position = state['position']
+			eliminator.pivots = state['pivots']
+			eliminator.nnz = sum(len(row) for row in eliminator.pivots.itervalues())
+			Instrument.gauge('resumed elimination', position, rank=len(eliminator))
+
+	if total is not None:
+		total = max(total - position, 0)
+	progress = Instrument.Progress('elimination', total, status=lambda: {'rank': len(eliminator), 'nnz': eliminator.nnz})
+	with Instrument.stage('elimination', detail=True):
+		for k, row in enumerate(markowitzOrder(rows, bufferSize)):
+			if k < position:
+				continue
+			Instrument.count('rows')
+			if eliminator.insert(row):
+				Instrument.count('pivots')
+			progress.step()
+			if checkpoint is not None and checkpoint.due():
+				checkpoint.save({'modulus': modulus, 'position': k + 1, 'pivots': eliminator.pivots})
+		basis = eliminator.basis(reduced)
+		Instrument.gauge('nnz', eliminator.nnz, rank=len(eliminator))
+
+	return basis
+
+# returns the rank of rows over GF(modulus), without back-substituting or lifting the pivots
+# rows are inserted in Markowitz order as for rowBasis, and elimination stops as soon as the rank reaches bound, if given
+# (e.g. the number of columns), without consuming the rest of the rows
+# the rank over GF(p) is at most the rank over the rationals, and equal to it unless p divides all the maximal minors
+# instrumented as the stage 'rank', counting rows and pivots
+def rowRank(rows, modulus=defaultModulus, bufferSize=None, bound=None):
+	eliminator = Eliminator(modulus)
+	if bound == 0:
+		return 0
+
+	progress = Instrument.Progress('rank', status=lambda: {'rank': len(eliminator), 'nnz': eliminator.nnz})
+	with Instrument.stage('rank', detail=True):
+		for row in markowitzOrder(rows, bufferSize):
+			Instrument.count('rows')
+			for col in [c for c in row if modulus is not None and row[c] % modulus == 0]:
+				del row[col]
+			if eliminator.insert(row):
+				Instrument.count('pivots')
+				if len(eliminator) == bound:
+					Instrument.count('early stops')
+					break
+			progress.step()
+
+	return len(eliminator)
+
+# dense multimodular solving
+# a dense system A x = b with integer entries is solved through its normal equations A^T A x = A^T b, modulo a sequence
+# of primes below 2^21, small enough that A^T A can be formed modulo p by floating point matrix products over chunks of
+# 2^11 rows, whose sums of products of residues are below 2^53 and so exact
+# residues of the solution are combined by chinese remaindering until rational reconstruction stabilizes,
+# and the reconstructed solution is then verified exactly, so the result is certified rather than probable
+# primes whose pivot columns differ from the best seen so far are unlucky (they divide some minor) and are discarded
+
+# primes used for dense solving so far, in decreasing order
+densePrimes = []
+densePrimeBound = 2 ** 21
+denseChunkRows = 2 ** 11
+
+# returns the kth prime used for dense solving
+def densePrime(k):
+	candidate = densePrimes[-1] if densePrimes else densePrimeBound
+	while len(densePrimes) <= k:
+		candidate -= 1
+		if candidate % 2 and all(candidate % d for d in xrange(3, isqrt(candidate) + 1, 2)):
+			densePrimes.append(candidate)
+
+	return densePrimes[k]
+
+# returns the residues of an integer array (int64 or object) modulo p, as an int64 array
+def residues(A, p):
+	if A.dtype == object:
+		return (A % p).astype(numpy.int64)
+	return A % p
+
+# returns A^T B modulo p for int64 arrays of residues modulo a prime below 2^21
+def transposeProductMod(A, B, p):
+	result = numpy.zeros((A.shape[1], B.shape[1]), dtype=numpy.int64)
+	for start in xrange(0, A.shape[0], denseChunkRows):
+		chunkA = A[start:start + denseChunkRows].astype(numpy.float64)
+		chunkB = B[start:start + denseChunkRows].astype(numpy.float64)
+		result = (result + chunkA.T.dot(chunkB).astype(numpy.int64)) % p
+
+	return result
+
+# reduces an int64 matrix of residues modulo p to reduced row echelon form in place, returning its pivot columns
+def echelonMod(M, p):
+	pivots = []
+	r = 0
+	for c in xrange(M.shape[1]):
+		if r == M.shape[0]:
+			break
+		nonzero = numpy.flatnonzero(M[r:, c])
+		if len(nonzero) == 0:
+			continue
+		k = r + nonzero[0]
+		if k != r:
+			M[[r, k]] = M[[k, r]]
+		M[r, c:] = M[r, c:] * inverseMod(int(M[r, c]), p) % p
+
+		# eliminate column c from the other rows that have it
+		factors = M[:, c].copy()
+		factors[r] = 0
+		others = numpy.flatnonzero(factors)
+		M[others, c:] = (M[others, c:] - numpy.outer(factors[others], M[r, c:])) % p
+
+		pivots.append(c)
+		r += 1
+
+	return pivots
+
+# returns (scale, integers) where integers is the object array of a list of integers or fractions times scale,
+# the least common multiple of their denominators
+def clearDenominators(values):
+	scale = 1
+	for value in values:
+		value = Fraction(value)
+		scale = scale * value.denominator / gcd(scale, value.denominator)
+
+	return scale, numpy.array([int(Fraction(value) * scale) for value in values], dtype=object)
+
+# solves a consistent square system N x = c with integer entries by elimination modulo a sequence of primes
+# augmentedMod(p) returns the int64 residues of [N | c] modulo p, and verify(pivots, y, denominator) checks a candidate
+# solution exactly, given as the object array y = denominator * x, returning a result to return or None to go on
+def multimodularSolve(augmentedMod, numColumns, verify):
+	best = None
+	k = 0
+	while True:
+		p = densePrime(k)
+		k += 1
+		M = augmentedMod(p)
+		pivots = echelonMod(M, p)
+
+		# more pivots, or at the same number earlier pivot columns, mean the previous primes were unlucky
+		# the system is consistent, so a pivot in the last column also marks an unlucky prime
+		if numColumns in pivots:
+			continue
+		if best is None or (-len(pivots), pivots) < (-len(best), best):
+			best = pivots
+			modulus, lifted, previous = 1, None, None
+		elif pivots != best:
+			continue
+
+		# combine the residues of the solution with those modulo earlier primes
+		solution = [int(M[j, numColumns]) for j in range(len(pivots))]
+		if lifted is None:
+			lifted = solution
+		else:
+			factor = inverseMod(modulus, p)
+			lifted = [x + modulus * ((y - x) * factor % p) for x, y in zip(lifted, solution)]
+		modulus *= p
+
+		reconstructed = [rationalReconstruct(x, modulus) for x in lifted]
+		if None in reconstructed or reconstructed != previous:
+			previous = reconstructed
+			continue
+
+		# verify the solution exactly, clearing denominators
+		denominator = 1
+		for value in reconstructed:
+			denominator = denominator * value.denominator / gcd(denominator, value.denominator)
+		y = numpy.zeros(numColumns, dtype=object)
+		for c, value in zip(pivots, reconstructed):
+			y[c] = value.numerator * (denominator / value.denominator)
+		result = verify(pivots, y, denominator)
+		if result is not None:
+			return result
+
+# returns (x, pivots, consistent) for a dense system A x = b, where A is an integer array (int64 or object)
+# and b a list of integers or fractions
+# x is an exact least squares solution (as a list of fractions), with the variables of the non-pivot columns set to zero,
+# so the system is underdetermined exactly when there are fewer pivots than columns
+# consistent is whether x solves the system exactly; if it does not and leastSquares is not set, x is None instead
+def solveDense(A, b, leastSquares=True):
+	numColumns = A.shape[1]
+	# with no variables, the empty solution is the least squares solution, and exact only if b is zero
+	if numColumns == 0:
+		consistent = not any(b)
+		return ([] if consistent or leastSquares else None), [], consistent
+
+	exactA = A.astype(object)
+	scale, exactB = clearDenominators(b)
+
+	def augmentedMod(p):
+		Ap = residues(A, p)
+		return transposeProductMod(Ap, numpy.hstack([Ap, residues(exactB, p).reshape(-1, 1)]), p)
+
+	def verify(pivots, y, denominator):
+		x = [Fraction(value, denominator * scale) for value in y]
+		residual = exactA.dot(y) - denominator * exactB
+		if not any(residual):
+			return x, pivots, True
+		if not any(exactA.T.dot(residual)):
+			if leastSquares:
+				return x, pivots, False
+			return None, pivots, False
+
+	return multimodularSolve(augmentedMod, numColumns, verify)
+
+# returns (x, pivots) for the normal equations N x = c of a least squares problem, given exactly
+# N is a symmetric integer array (int64 or object) and c a list of integers or fractions
+# x is as for solveDense, an exact solution with the variables of the non-pivot columns set to zero
+def solveNormal(N, c):
+	numColumns = N.shape[1]
+	if numColumns == 0:
+		return [], []
+
+	exactN = N.astype(object)
+	scale, exactC = clearDenominators(c)
+
+	def augmentedMod(p):
+		return numpy.hstack([residues(N, p), residues(exactC, p).reshape(-1, 1)])
+
+	def verify(pivots, y, denominator):
+		if not any(exactN.dot(y) - denominator * exactC):
+			return [Fraction(value, denominator * scale) for value in y], pivots
+
+	return multimodularSolve(augmentedMod, numColumns, verify)
@@ -1,177 +1,181 @@
 # Exterior Algebra module
 # All methods are essentially sparse
+# the underlying vector space has an indexed basis e_0, e_1, ..., and a basis vector (wedge monomial) of the
+# exterior algebra is stored as an integer bitmask, with bit b set if e_b appears in the wedge product
+
+import Elimination
+from bisect import bisect_left
 
 # helper functions
 
-# puts a basis vector in standard form, modifying the sign of the coefficient appropriately
-# if the basis vector contains repeated terms (i.e. is 0), a coefficient of 0 is returns
-# works by modified merge sort
-def standardForm(coeffVectorPair):
-	coeff, basisVector = coeffVectorPair
-	length = len(basisVector)
-	
-	if length == 1:
-		return coeffVectorPair
-	
-	firstHalf = basisVector[:(length+1)/2]
-	secondHalf = basisVector[(length+1)/2:]
-	sign1, firstHalfSorted = standardForm((1, firstHalf))
-	sign2, secondHalfSorted = standardForm((1, secondHalf))
-
-	# catch failure from firstHalf or secondHalf having repeated terms
-	if sign1 == 0 or sign2 == 0:
-		return 0, []
-
-	# merge step
-	coeff *= sign1 * sign2
-	i = 0
-	basisVectorSorted = []
-	for elem in firstHalfSorted:
-		# add elements from the second half until they are >= elem or we run out of elements
-		while i < len(secondHalfSorted) and elem > secondHalfSorted[i]:
-			basisVectorSorted.append(secondHalfSorted[i])
-			i += 1
-			coeff = -coeff
-
-		# test for failure due to repeated elements
-		if i < len(secondHalfSorted) and elem == secondHalfSorted[i]:
-			return 0, []
-
-		basisVectorSorted.append(elem)
-	
-	# append remaining elements to basisVectorSorted
-	for elem in secondHalfSorted[i:]:
-		basisVectorSorted.append(elem)
-	
-	return coeff, basisVectorSorted
-
-# multiplies two basis vectors with coefficients
-# assumes the arguments are in standard form
-# result is also in standard form
-# if result is 0, returns (0, [])
-def mult(x, y):
-	coeff1, basisVector1 = x
-	coeff2, basisVector2 = y
-	newBasisVector = []
-	i = 0
-	for elt in basisVector1:
-		while i < len(basisVector2) and elt > basisVector2[i]:
-			newBasisVector.append(basisVector2[i])
-			i += 1
-		if i < len(basisVector2) and elt == basisVector2[i]:
-			return 0, []
-		newBasisVector.append(elt)
-	newBasisVector.extend(basisVector2[i:])
-
-	if i % 2 == 0:
-		return coeff1 * coeff2, newBasisVector
+# returns the number of set bits of a bitmask
+def popcount(mask):
+	return bin(mask).count('1')
+
+# returns the bitmask of the wedge monomial of a collection of basis indices, ignoring order and sign
+def monomial(basisIndices):
+	mask = 0
+	for b in basisIndices:
+		mask |= 1 << b
+
+	return mask
+
+# returns the sorted list of basis indices appearing in a wedge monomial
+def basisIndices(mask):
+	result = []
+	b = 0
+	while mask:
+		if mask & 1:
+			result.append(b)
+		mask >>= 1
+		b += 1
+
+	return result
+
+# puts a wedge product of basis vectors, given as a list of basis indices in any order, in standard form
+# returns (coeff, mask) with the sign of the coefficient modified appropriately
+# if the list contains repeated indices (i.e. is 0), returns (0, 0)
+# each new index moves past the indices greater than it that are already present, whose number is a popcount
+def standardForm(coeff, indices):
+	mask = 0
+	inversions = 0
+	for b in indices:
+		bit = 1 << b
+		if mask & bit:
+			return 0, 0
+		inversions += popcount(mask >> b)
+		mask |= bit
+
+	if inversions % 2 == 0:
+		return coeff, mask
 	else:
-		return -coeff1 * coeff2, newBasisVector
+		return -coeff, mask
+
+# returns the sign of the wedge product of two disjoint monomials, relative to their union in standard form
+# the sign is the parity of the number of pairs a in mask1, b in mask2 with a > b
+def sign(mask1, mask2):
+	inversions = 0
+	while mask2:
+		low = mask2 & -mask2
+		inversions += popcount(mask1 & ~((low << 1) - 1))
+		mask2 ^= low
+
+	if inversions % 2 == 0:
+		return 1
+	return -1
+
+# multiplies two basis vectors with coefficients, given as (coeff, mask) pairs
+# if result is 0, returns (0, 0)
+def mult(x, y):
+	coeff1, mask1 = x
+	coeff2, mask2 = y
+	if mask1 & mask2:
+		return 0, 0
+
+	return sign(mask1, mask2) * coeff1 * coeff2, mask1 | mask2
 
 # class Element
-# represents an element of the exterior algebra of an ordered vector space
+# represents an element of the exterior algebra of an indexed vector space
+# terms are stored as parallel lists of coefficients and monomial bitmasks
 
 class Element:
-	def __init__(self, coeffVectorPairs):
-		self.coeffVectorPairs = coeffVectorPairs
+	def __init__(self, coeffs, monomials):
+		self.coeffs = coeffs
+		self.monomials = monomials
 
 	def __str__(self):
-		return str(self.coeffVectorPairs)
-
-	# standard form has all basis vectors in standard form, no repeated or null basis vectors, and the basis vectors sorted
-	def standardForm(self, standardBasisVectors=False):
-		# put the basis vectors in standard form, if not already
-		if not standardBasisVectors:
-			self.coeffVectorPairs = map(standardForm, self.coeffVectorPairs)
-		
-		# sort the result by the basis vector
-		self.coeffVectorPairs.sort(key=lambda x: x[1])
-
-		# add up elements with the same basis vector
-		i = 0
-		while i < len(self.coeffVectorPairs) - 1:
-			coeff1, basisVector1 = self.coeffVectorPairs[i]
-			coeff2, basisVector2 = self.coeffVectorPairs[i+1]
-			if basisVector1 == basisVector2:
-				self.coeffVectorPairs[i] = coeff1 + coeff2, basisVector1
-				self.coeffVectorPairs.pop(i+1)
-			else:
-				i += 1
+		return str(zip(self.coeffs, [basisIndices(mask) for mask in self.monomials]))
 
-		# remove elements with coefficient 0
-		self.coeffVectorPairs = [x for x in self.coeffVectorPairs if x[0] != 0]
+	def __len__(self):
+		return len(self.monomials)
 
-	def scale(self, scalar):
-		result = []
-		for elem in self.coeffVectorPairs:
-			coeff, basisVector = elem
-			result.append((scalar * coeff, basisVector))
+	# standard form has no repeated or null monomials, and the monomials sorted
+	def standardForm(self):
+		terms = {}
+		for coeff, mask in zip(self.coeffs, self.monomials):
+			terms[mask] = terms.get(mask, 0) + coeff
 
-		return Element(result);
+		self.monomials = sorted(mask for mask in terms if terms[mask] != 0)
+		self.coeffs = [terms[mask] for mask in self.monomials]
+
+	def scale(self, scalar):
+		return Element([scalar * coeff for coeff in self.coeffs], list(self.monomials))
 
 	# assumes both elements are in standard form
 	# result is in standard form
-	# if the result is 0, returns []
 	def add(self, y):
-		result = []
+		coeffs, monomials = [], []
 		i = 0
-		for elem in self.coeffVectorPairs:
-			coeff, basisVector = elem
-			while i < len(y.coeffVectorPairs) and basisVector > y.coeffVectorPairs[i][1]:
-				result.append(y.coeffVectorPairs[i])
+		for coeff, mask in zip(self.coeffs, self.monomials):
+			while i < len(y.monomials) and mask > y.monomials[i]:
+				coeffs.append(y.coeffs[i])
+				monomials.append(y.monomials[i])
 				i += 1
-			if i < len(y.coeffVectorPairs) and basisVector == y.coeffVectorPairs[i][1]:
-				newCoeff = coeff + y.coeffVectorPairs[i][0]
+			if i < len(y.monomials) and mask == y.monomials[i]:
+				newCoeff = coeff + y.coeffs[i]
 				if newCoeff != 0:
-					result.append((newCoeff, basisVector))
+					coeffs.append(newCoeff)
+					monomials.append(mask)
 				i += 1
 			else:
-				result.append(elem)
+				coeffs.append(coeff)
+				monomials.append(mask)
 
-		# append remaining element of y.coeffVectorPairs
-		for elem in y.coeffVectorPairs[i:]:
-			result.append(elem)
+		# append remaining terms of y
+		coeffs.extend(y.coeffs[i:])
+		monomials.extend(y.monomials[i:])
 
-		return Element(result)
+		return Element(coeffs, monomials)
 
-	# assumes both elements are in standard form (or at least their basisVectors are)
 	# result is in standard form
 	def mult(self, y):
-		result = Element([mult(a, b) for a in self.coeffVectorPairs for b in y.coeffVectorPairs])
-		result.standardForm(standardBasisVectors = True)
+		terms = {}
+		for coeff1, mask1 in zip(self.coeffs, self.monomials):
+			for coeff2, mask2 in zip(y.coeffs, y.monomials):
+				if mask1 & mask2:
+					continue
+				mask = mask1 | mask2
+				terms[mask] = terms.get(mask, 0) + sign(mask1, mask2) * coeff1 * coeff2
+
+		result = Element([], [])
+		result.monomials = sorted(mask for mask in terms if terms[mask] != 0)
+		result.coeffs = [terms[mask] for mask in result.monomials]
 
 		return result
 
-	# returns the coefficient of a given basis vector in an element
-	def getCoeff(self, basisVector):
-		for elem in self.coeffVectorPairs:
-			coeff, vector = elem
-			if vector == basisVector:
-				return coeff
+	# returns the coefficient of a given monomial in an element in standard form
+	def getCoeff(self, mask):
+		k = bisect_left(self.monomials, mask)
+		if k < len(self.monomials) and self.monomials[k] == mask:
+			return self.coeffs[k]
 
 		return 0
 
 # other useful functions
 
-# reduces a list of elements to a basis for their span
-def getBasis(spanningSet):
-	i = 0
-	while i < len(spanningSet):
-		# update user on progress
-		if i % 100 == 0:
-			print('{} / {}'.format(i, len(spanningSet)))
-
-		# clear the column corresponding to the first basis vector of spanningSet[i]
-		coeff, basisVector = spanningSet[i].coeffVectorPairs[0]
-		j = i + 1
-		while j < len(spanningSet):
-			multiplier = - spanningSet[j].getCoeff(basisVector) / float(coeff)
-			if multiplier != 0:
-				spanningSet[j] = spanningSet[j].add(spanningSet[i].scale(multiplier))
-		
-			#remove elements which are 0
-			if not spanningSet[j].coeffVectorPairs:
-				del spanningSet[j]
-			else:
-				j += 1
-		i += 1
+# reduces a list of elements to a basis for their span, modifying the list in place
+# elimination is exact, over the rationals by default or over GF(modulus) with rational reconstruction if a modulus is given
+# the resulting basis is in echelon form, sorted by leading monomial, and in reduced echelon form if reduced is set
+# elimination saves to and resumes from checkpoint, if given (see Elimination.rowBasis)
+def getBasis(spanningSet, modulus=None, reduced=False, checkpoint=None):
+	rows = [dict(zip(elt.monomials, elt.coeffs)) for elt in spanningSet]
+	basis = Elimination.rowBasis(rows, modulus, reduced, checkpoint=checkpoint, total=len(rows))
+
+	spanningSet[:] = [Element([row[mask] for mask in sorted(row)], sorted(row)) for row in basis]
+
+# returns a basis for the span of an iterable of elements, consumed as a stream
+# elements are reduced as they arrive, in Markowitz order within buffers of bufferSize elements,
+# so only the basis and one buffer are held in memory
+# elimination saves to and resumes from checkpoint, if given, in which case the stream must be the same on resuming
+def spanBasis(elements, modulus=None, reduced=False, bufferSize=1024, checkpoint=None):
+	rows = (dict(zip(elt.monomials, elt.coeffs)) for elt in elements)
+
+	return rowSpanBasis(rows, modulus, reduced, bufferSize, checkpoint)
+
+# returns a basis for the span of an iterable of elements given as dicts from monomial bitmasks to coefficients,
+# such as the rows of a batch of products built in bulk (see Action.matrixRows), as for spanBasis
+# total is the number of rows, or an upper bound on it, for progress reports (see Elimination.rowBasis)
+def rowSpanBasis(rows, modulus=None, reduced=False, bufferSize=1024, checkpoint=None, total=None):
+	basis = Elimination.rowBasis(rows, modulus, reduced, bufferSize, checkpoint, total)
+
+	return [Element([row[mask] for mask in sorted(row)], sorted(row)) for row in basis]
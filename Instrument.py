@@ -0,0 +1,199 @@
+# Instrument module
+# stage timers, counters, gauges and progress reporting with ETA for long computations
+# instrumentation produces events (dicts with a kind, a name, a time and further fields), which are passed to listeners,
+# such as a metrics file of JSON lines or the console progress display
+# with no listeners, which is the default, every call returns immediately, so instrumented code runs at full speed
+# setting the environment variable BONUS_METRICS_FILE to a path adds a metrics file listener at import
+
+import os
+import json
+import time
+import resource
+
+# functions called with each event
+listeners = []
+
+# running totals of counters, included in the events of the stages during which they change
+counters = {}
+
+# helper functions
+
+# returns the peak resident memory of the process so far, in kilobytes
+def peakKB():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# returns whether anything is listening for events
+def enabled():
+	return bool(listeners)
+
+# sends an event to all listeners
+def emit(kind, name, **fields):
+	if not listeners:
+		return
+
+	event = {'kind': kind, 'name': name, 'time': time.time()}
+	event.update(fields)
+	for listener in listeners:
+		listener(event)
+
+# adds k to a counter
+def count(name, k=1):
+	if listeners:
+		counters[name] = counters.get(name, 0) + k
+
+# records the value of a gauge, e.g. a matrix size
+def gauge(name, value, **fields):
+	if listeners:
+		emit('gauge', name, value=value, **fields)
+
+# generates the items of an iterable, counting them under name
+def counted(name, iterable):
+	if not listeners:
+		return iterable
+
+	return countedItems(name, iterable)
+
+def countedItems(name, iterable):
+	for item in iterable:
+		count(name)
+		yield item
+
+# class Stage
+# a context manager timing a stage of a computation
+# emits a 'start' event on entry, and on exit a 'stage' event with the time taken, the peak memory and the changes
+# of the counters during the stage
+# detail stages (e.g. one per cycle type) are not shown by the console progress display
+
+class Stage:
+	def __init__(self, name, detail, fields):
+		self.name = name
+		self.detail = detail
+		self.fields = fields
+
+	def __enter__(self):
+		self.counters = dict(counters)
+		emit('start', self.name, detail=self.detail, **self.fields)
+		self.start = time.time()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		seconds = time.time() - self.start
+		changes = {}
+		for name, value in counters.iteritems():
+			if value != self.counters.get(name, 0):
+				changes[name] = value - self.counters.get(name, 0)
+		emit('stage', self.name, detail=self.detail, seconds=seconds, peakKB=peakKB(), counters=changes,
+			failed=excType is not None, **self.fields)
+
+		return False
+
+# a stage that does nothing, used when there are no listeners
+class NullStage:
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		return False
+
+nullStage = NullStage()
+
+# returns a context manager timing a stage
+def stage(name, detail=False, **fields):
+	if not listeners:
+		return nullStage
+
+	return Stage(name, detail, fields)
+
+# class Progress
+# tracks the progress of a loop of total steps (or an unknown number if total is None), emitting a 'progress' event
+# with the elapsed time, the rate and the ETA at most once every interval seconds, and at the end
+# status is an optional function returning a dict of further fields, only called when an event is emitted
+
+class Progress:
+	def __init__(self, name, total=None, interval=1., status=None, **fields):
+		self.name = name
+		self.total = total
+		self.interval = interval
+		self.status = status
+		self.fields = fields
+		self.done = 0
+		self.start = time.time()
+		self.nextReport = self.start + interval
+
+	# records k more steps
+	def step(self, k=1):
+		self.done += k
+		if listeners and (self.done == self.total or time.time() >= self.nextReport):
+			self.report()
+
+	# emits a progress event
+	def report(self):
+		now = time.time()
+		self.nextReport = now + self.interval
+		elapsed = now - self.start
+		rate = self.done / elapsed if elapsed > 0 else None
+		eta = None
+		if self.total is not None and rate:
+			eta = (self.total - self.done) / rate
+
+		fields = dict(self.fields)
+		if self.status is not None:
+			fields.update(self.status())
+		emit('progress', self.name, done=self.done, total=self.total, elapsed=elapsed, rate=rate, eta=eta, **fields)
+
+# listeners
+
+# class MetricsFile
+# a listener appending events to a file as JSON lines
+
+class MetricsFile:
+	def __init__(self, path):
+		self.path = path
+		self.file = open(path, 'a', 1)
+
+	def __call__(self, event):
+		self.file.write(json.dumps(event, sort_keys=True, default=str) + '\n')
+
+	def close(self):
+		self.file.close()
+
+# returns the string of the fields of an event other than the standard ones, e.g. 'n=10 i=3'
+def fieldString(event, exclude):
+	return ' '.join('{}={}'.format(key, event[key]) for key in sorted(event) if key not in exclude)
+
+standardFields = set(['kind', 'name', 'time', 'detail', 'seconds', 'peakKB', 'counters', 'failed',
+	'done', 'total', 'elapsed', 'rate', 'eta'])
+
+# a listener printing stages and progress, with ETAs, for people watching long runs
+def consoleProgress(event):
+	if event.get('detail'):
+		return
+
+	fields = fieldString(event, standardFields)
+	if event['kind'] == 'start':
+		print('calculating {} {}'.format(event['name'], fields).rstrip())
+	elif event['kind'] == 'stage':
+		counterString = ' '.join('{}={}'.format(key, value) for key, value in sorted(event['counters'].iteritems()))
+		print('finished {} {} in {:.2f}s, peak memory {}MB {}'.format(event['name'], fields, event['seconds'],
+			event['peakKB'] / 1024, counterString).replace('  ', ' ').rstrip())
+	elif event['kind'] == 'progress':
+		if event['total'] is None:
+			done = '{}'.format(event['done'])
+		else:
+			done = '{}/{} ({:.0f}%)'.format(event['done'], event['total'], 100. * event['done'] / max(event['total'], 1))
+		line = '{}: {}, {:.1f}s elapsed'.format(event['name'], done, event['elapsed'])
+		if event['eta'] is not None:
+			line += ', ETA {:.1f}s'.format(event['eta'])
+		if fields:
+			line += ', ' + fields
+		print(line)
+
+# adds a listener writing events to the metrics file at path, returning it
+def addMetricsFile(path):
+	listener = MetricsFile(path)
+	listeners.append(listener)
+
+	return listener
+
+if os.environ.get('BONUS_METRICS_FILE'):
+	addMetricsFile(os.environ['BONUS_METRICS_FILE'])
@@ -1,12 +1,25 @@
 # Interpolate module
 # interpolates the cycle polynomial for the character from the bonus problem from Math 267, HW 6
-# Usage: python Interpolate.py i filename
+# Usage: python Interpolate.py x i filename
+#        python Interpolate.py batch jobfile filename outfile [processes]
+#
+# in batch mode, jobfile is a JSON list of jobs, each an object with keys
+#   i: the character to interpolate
+#   x (optional, default 0): the smallest n whose character values are used, raised as in cyclePolynomial
+#   d and r, or terms: the degree and number of cycle variables of likelyMonomials, or an explicit list of terms
+#   refine (optional, default true): true to refine until the support stops changing, false not to refine,
+#     or the maximum number of refinements
+#   exact (optional, default true): whether to interpolate exactly or by floating point least squares
+# and outfile receives one JSON object per job, in order, with the job, the resulting support and coefficients
+# (exact coefficients as strings such as '-1/12'), the error, the number of refinements and the time taken
 
 import CyclePolynomials as cp
-import pickle
+import Results
 import numpy
-from json import loads
-from Bonus import *
+import time
+from json import loads, load, dumps
+from sys import argv
+from Bonus import V
 
 # NOTE: heuristic, not rigorous
 # returns the most likely monomials of degree at most d in r cycle variables to appear in the character's cycle polynomial
@@ -17,44 +30,62 @@ def likelyMonomials(d, r):
 
 	return [monomial for monomial in allMonomials if cp.weight(monomial) <= d]
 
-# interpolates the best cycle polynomial for the ith desired character
-# works by minimizing the error across V_x through V_n where x is as small as possible s.t. its ith exterior product is nonzero
-# obtains the degree d and number of variables r from stdin, or alternatively a list of monomials
-# retrieves the character values from filename
-def cyclePolynomial(x, i, filename):
+# returns (x, n, values) for the character values of V_x through V_n for the ith desired character, flattened
+# x is raised to be as small as possible s.t. the ith exterior product of V_x is nonzero and its character is stored
+# retrieves the character values from the results store filename
+def characterValues(x, i, filename):
 	# compute the smallest possible x such that the ith exterior power of x is nonzero
 	while x < 2 or len(V(x)) < i:
 		x += 1
 
-	# retrieve character values
-	inputFile = open(filename, 'rb')
-	inputFile.seek(0, 2)
-	fileLength = inputFile.tell()
-	inputFile.seek(0)
-	characterVals = []
-	while inputFile.tell() < fileLength:
-		characterVals.append(pickle.load(inputFile))
-
-	inputFile.close()
-
-	# sort charcterVals just in case
-	characterVals.sort()
-
-	# filter character values to get characters for correct i and remove characters for V_k, k < x
-	characterVals = filter(lambda y: y[0][0] >= x and y[0][1] == i, characterVals)
-
-	# check character values
-	for val in characterVals:
-		print(val)
+	# retrieve character values, sorted by n, and remove characters for V_k, k < x
+	characterVals = filter(lambda y: y[0][0] >= x, Results.ResultsStore(filename, create=False).records(i))
+	if not characterVals:
+		raise ValueError('no character values stored for i = {}'.format(i))
 
 	# adjust x to be the smallest k such that the character of V_k is included in characterVals
-	x = characterVals[0][0][0]	
+	x = characterVals[0][0][0]
 	# set n to be the largest
 	n = characterVals[len(characterVals) - 1][0][0]
 
 	# remove the tuples from characterVals and flatten
-	characterVals = map(lambda y: y[1], characterVals)
-	characterVals = sum(characterVals, [])
+	return x, n, sum(map(lambda y: y[1], characterVals), [])
+
+# refines a cycle polynomial by interpolating again on its nonzero terms, until the support stops changing
+# or maxRounds refinements have been made
+# returns the refined polynomial and the number of refinements
+def refineCyclePoly(x, n, characterVals, soln, maxRounds=None, exact=True):
+	rounds = 0
+	while maxRounds is None or rounds < maxRounds:
+		terms = soln.nonzeroTerms()
+		if terms == soln.terms:
+			break
+		soln = cp.multiInterpolate(x, n, characterVals, terms, exact)
+		rounds += 1
+
+	return soln, rounds
+
+# updates an incremental fit (see cp.IncrementalFit) of the ith desired character with the characters of V_k, k >= x,
+# stored in the results store filename since it was last updated, so a fit can follow a running characterDump
+# returns the fit, which is created with the given terms if fit is None
+def updateFit(fit, x, i, filename, terms=None):
+	if fit is None:
+		fit = cp.IncrementalFit(terms)
+	for (k, j), values in Results.ResultsStore(filename, create=False).records(i):
+		if k >= x and len(V(k)) >= i and k not in fit.characters:
+			fit.addCharacter(k, values)
+
+	return fit
+
+# interpolates the best cycle polynomial for the ith desired character
+# works by minimizing the error across V_x through V_n where x is as small as possible s.t. its ith exterior product is nonzero
+# obtains the degree d and number of variables r from stdin, or alternatively a list of monomials
+# retrieves the character values from the results store filename
+def cyclePolynomial(x, i, filename):
+	x, n, characterVals = characterValues(x, i, filename)
+
+	# check character values
+	print(characterVals)
 
 	# get d and r (or all terms) from stdin and interpolate until user is satisfied
 	# user can opt to refine the result by restricting to terms with substantially nonzero coefficient
@@ -69,8 +100,12 @@ def cyclePolynomial(x, i, filename):
 			r = int(raw_input('Enter r: '))
 			terms = likelyMonomials(d, r)
 
-		# find solution
-		soln = cp.multiInterpolate(x, n, characterVals, terms)
+		# find solution, which fails if the terms are not determined by the character values
+		try:
+			soln = cp.multiInterpolate(x, n, characterVals, terms)
+		except ValueError as error:
+			print(error)
+			continue
 		print(soln)
 
 		# refine soln if desired
@@ -85,7 +120,113 @@ def cyclePolynomial(x, i, filename):
 
 	return soln
 
-# MAIN: runs cyclePolynomial(n, i)
+# batch mode
+
+# character values and jobs shared with the worker processes of batchInterpolate, keyed by (x, i) and by job number
+sharedValues = {}
+sharedJobs = []
+
+# returns the initial terms of a job
+def jobTerms(job):
+	if 'terms' in job:
+		return job['terms']
+	return likelyMonomials(job['d'], job['r'])
+
+# returns a coefficient or error in a form for the JSON output, with fractions as strings so that they stay exact
+def jsonNumber(value):
+	if isinstance(value, (int, long, float)):
+		return value
+	if isinstance(value, numpy.ndarray):
+		return value.tolist()
+	return str(value)
+
+# returns (x, n, values) of a job (see characterValues), loaded from the results store filename once per (x, i)
+# an error loading them is kept, and raised again for every job needing them
+def jobValues(job, filename=None):
+	key = job.get('x', 0), job['i']
+	if key not in sharedValues:
+		try:
+			sharedValues[key] = characterValues(key[0], key[1], filename)
+		except Exception as error:
+			sharedValues[key] = error
+	if isinstance(sharedValues[key], Exception):
+		raise sharedValues[key]
+
+	return sharedValues[key]
+
+# runs the kth shared job, returning its result as a dict
+# a job that fails returns a failure record instead, so the other jobs still run
+def jobTask(k):
+	job = sharedJobs[k]
+	result = {'job': job}
+	start = time.time()
+	try:
+		x, n, characterVals = jobValues(job)
+		result['x'], result['n'] = x, n
+		exact = job.get('exact', True)
+		refine = job.get('refine', True)
+		if refine is True:
+			maxRounds = None
+		else:
+			maxRounds = int(refine)
+
+		soln = cp.multiInterpolate(x, n, characterVals, jobTerms(job), exact)
+		soln, rounds = refineCyclePoly(x, n, characterVals, soln, maxRounds, exact)
+		result['support'] = soln.nonzeroTerms()
+		result['coefficients'] = [jsonNumber(coeff) for coeff in soln.coefficients if cp.isNonzero(coeff)]
+		result['polynomial'] = str(soln)
+		result['error'] = jsonNumber(soln.error)
+		result['refinements'] = rounds
+		result['stable'] = soln.nonzeroTerms() == soln.terms
+	except ValueError as error:
+		result['failure'] = str(error)
+	except Exception as error:
+		result['failure'] = '{}: {}'.format(type(error).__name__, error)
+	result['seconds'] = time.time() - start
+
+	return result
+
+# runs a list of interpolation jobs (see the usage above), writing a JSON object per job to outfile, in order
+# the character values and the design matrix columns of the initial terms are built once, before the jobs are shared
+# with a pool of processes, if processes > 1
+def batchInterpolate(jobs, filename, outfile, processes=1):
+	for job in jobs:
+		try:
+			x, n = jobValues(job, filename)[:2]
+			cp.designMatrix(x, n, object if job.get('exact', True) else numpy.float64).matrix(jobTerms(job))
+		except Exception:
+			# the job fails again in jobTask, which records the failure
+			pass
+	sharedJobs[:] = jobs
+
+	outputFile = open(outfile, 'w')
+	try:
+		if processes > 1:
+			from multiprocessing import Pool
+			pool = Pool(processes)
+			try:
+				for result in pool.imap(jobTask, range(len(jobs))):
+					outputFile.write(dumps(result, sort_keys=True) + '\n')
+					outputFile.flush()
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			for k in range(len(jobs)):
+				outputFile.write(dumps(jobTask(k), sort_keys=True) + '\n')
+				outputFile.flush()
+	finally:
+		outputFile.close()
+		sharedJobs[:] = []
+
+# MAIN: runs cyclePolynomial(x, i, filename), or batchInterpolate in batch mode, on the command line arguments args
+# (without the program name)
+def main(args):
+	if args[0] == 'batch':
+		batchInterpolate(load(open(args[1])), args[2], args[3], *map(int, args[4:5]))
+	else:
+		cyclePolynomial(int(args[0]), int(args[1]), args[2])
+
 if __name__ == '__main__':
-	cyclePolynomial(int(argv[1]), int(argv[2]), argv[3])
+	main(argv[1:])
 
@@ -0,0 +1,26 @@
+# Lazy module
+# modules imported on first use, so that commands which never touch a heavy backend such as numpy or scipy do not pay
+# for importing it at startup
+# a lazy module stands in for a module until one of its attributes is first looked up, then imports the module and
+# copies its attributes, so later lookups cost the same as on the module itself
+# only use it for third party modules, whose attributes are not reassigned after import
+
+import sys
+
+# class LazyModule
+# a placeholder for the module with the given dotted name, e.g. 'scipy.sparse'
+
+class LazyModule:
+	def __init__(self, name):
+		self.lazyName = name
+
+	# only called for attributes not yet copied from the module
+	def __getattr__(self, attribute):
+		__import__(self.lazyName)
+		self.__dict__.update(sys.modules[self.lazyName].__dict__)
+
+		return getattr(sys.modules[self.lazyName], attribute)
+
+# returns a lazy module for the module with the given dotted name
+def module(name):
+	return LazyModule(name)
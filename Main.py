@@ -0,0 +1,57 @@
+# Main module
+# a single command line for the bonus problem computations
+# USAGE: python Main.py dump m n i filename [processes]
+#        python Main.py sweep m n I filename
+#        python Main.py dimensions m n I [modular]
+#        python Main.py extchar n k
+#        python Main.py interpolate x i filename
+#        python Main.py interpolate batch jobfile filename outfile [processes]
+#        python Main.py bench m n I historyfile [baselinefile]
+#        python Main.py bench baseline historyfile baselinefile
+#        python Main.py queue coordinate|work|serve|local ...
+#        python Main.py results import picklefile storefile
+#
+# dump, sweep and dimensions are the forms of Bonus, interpolate those of Interpolate, bench those of Benchmark,
+# queue those of WorkQueue and results those of Results; extchar prints the character of the kth exterior power of V_n
+# on each cycle type
+# each subcommand imports only the modules it needs, and numpy and scipy are only imported once used (see Lazy), so
+# cheap queries such as extchar start in tens of milliseconds
+
+import sys
+
+# helper functions
+
+# prints the values of the character of the kth exterior power of V_n, one cycle type per line
+def extchar(args):
+	import Bonus
+	import Perm
+
+	n, k = int(args[0]), int(args[1])
+	for cycleType, value in zip(Perm.partitions(1, n), Bonus.characterExtV(n, k)):
+		print('{} {}'.format(list(cycleType), value))
+
+# returns a function running the main function of a module on the command line arguments, prefixed by args
+def moduleMain(name, *args):
+	return lambda rest: __import__(name).main(list(args) + rest)
+
+# the function run by each subcommand, passed the remaining command line arguments
+commands = {
+	'dump': moduleMain('Bonus'),
+	'sweep': moduleMain('Bonus', 'sweep'),
+	'dimensions': moduleMain('Bonus', 'dimensions'),
+	'extchar': extchar,
+	'interpolate': moduleMain('Interpolate'),
+	'bench': moduleMain('Benchmark'),
+	'queue': moduleMain('WorkQueue'),
+	'results': moduleMain('Results'),
+}
+
+# main function, runs a subcommand
+def main(args):
+	if not args or args[0] not in commands:
+		sys.exit('usage: python Main.py {} ...'.format('|'.join(sorted(commands))))
+
+	commands[args[0]](args[1:])
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
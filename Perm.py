@@ -2,6 +2,7 @@
 # implements functions relating to permutations, which are stored as lists
 
 from fractions import gcd
+from array import array
 
 # given a list of cycle lengths, returns a permutation of range(n) of the given cycle type
 def fromCycleType(n, cycleType):
@@ -13,12 +14,98 @@ def fromCycleType(n, cycleType):
 
 	return result
 
+# partitions are ordered lexicographically as sorted lists, and the rank of a partition is its position in this order
+
+# memoized partition counts and partition lists, keyed by (m, n)
+partitionCounts = {}
+partitionLists = {}
+
+# returns the number of partitions of n with smallest element at least m
+def partitionCount(m, n):
+	if n == 0:
+		return 1
+	if (m, n) not in partitionCounts:
+		partitionCounts[m, n] = sum(partitionCount(k, n - k) for k in range(m, n + 1))
+
+	return partitionCounts[m, n]
+
+# generates the partitions of n with smallest element at least m, in lexicographic order
+# works iteratively: the next partition replaces the last two parts by the lexicographically smallest
+# sequence of parts, each larger than the second to last part, with the same sum
+def iterPartitions(m, n):
+	if n == 0:
+		yield []
+		return
+	if n < m:
+		return
+
+	partition = [m] * (n / m)
+	partition[-1] += n % m
+	while True:
+		yield list(partition)
+		if len(partition) == 1:
+			return
+		last = partition.pop()
+		k = partition.pop() + 1
+		remainder = last + k - 1
+		while remainder >= 2 * k:
+			partition.append(k)
+			remainder -= k
+		partition.append(remainder)
+
 # returns a list of all partitions of n with smallest element at least m
 def partitions(m, n):
-	if n == 0:
-		return [[]]
+	if (m, n) not in partitionLists:
+		partitionLists[m, n] = map(tuple, iterPartitions(m, n))
+
+	return map(list, partitionLists[m, n])
 
-	return [[k] + partition for k in range(m, n + 1) for partition in partitions(k, n - k)]
+# returns the rank of a partition (as a sorted list) among the partitions of its sum with smallest element at least m
+def partitionRank(partition, m=1):
+	rank = 0
+	remaining = sum(partition)
+	for part in partition:
+		for k in range(m, part):
+			rank += partitionCount(k, remaining - k)
+		remaining -= part
+		m = part
+
+	return rank
+
+# returns the partition of n with smallest element at least m of a given rank
+def partitionUnrank(n, rank, m=1):
+	result = []
+	while n > 0:
+		k = m
+		while rank >= partitionCount(k, n - k):
+			rank -= partitionCount(k, n - k)
+			k += 1
+		result.append(k)
+		n -= k
+		m = k
+
+	return result
+
+# returns the multiplicity vector of a partition with parts at most n, whose (k-1)st entry is the number of parts equal to k
+def multiplicities(partition, n):
+	result = [0] * n
+	for part in partition:
+		result[part - 1] += 1
+
+	return result
+
+# multiplicity tables, keyed by n
+multiplicityTables = {}
+
+# returns the multiplicity vectors of all partitions of n, in order of rank, as one flat array with rows of length n
+def multiplicityTable(n):
+	if n not in multiplicityTables:
+		table = array('H')
+		for partition in partitions(1, n):
+			table.extend(multiplicities(partition, n))
+		multiplicityTables[n] = table
+
+	return multiplicityTables[n]
 
 # returns a list of permutations of range(n) containing one of each cycle type
 def allCycleTypes(n):
@@ -33,3 +120,18 @@ def powerCycleType(cycleType, k):
 	result.sort()
 
 	return result
+
+# returns the power map table of S_n up to M
+# row m is the list of ranks of the mth powers of the partitions of n, in order of rank
+# the mth power of a cycle type only depends on gcd(m, k) for k <= n, so rows are shared between such m
+def powerMapTable(n, M):
+	cycleTypes = partitions(1, n)
+	rows = {}
+	result = []
+	for m in range(M + 1):
+		key = tuple(gcd(m, k) for k in range(1, n + 1))
+		if key not in rows:
+			rows[key] = [partitionRank(powerCycleType(cycleType, m)) for cycleType in cycleTypes]
+		result.append(rows[key])
+
+	return result
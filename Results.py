@@ -0,0 +1,197 @@
+# Results module
+# implements an appendable store of character values, indexed by (n, i)
+# USAGE: python Results.py import picklefile storefile
+#
+# a store is a data file of records plus an index file (the data file name with '.idx' appended)
+# each record holds the values of one character as a contiguous column, either float64, or exact rationals
+# as int64 numerator and denominator columns
+# the index has one fixed size entry per record, so looking up a record is a dict lookup and a single read
+# appends take an exclusive lock on the data file, so several processes can write to the same store
+# if (n, i) is written more than once, the latest record wins
+
+import os
+import struct
+import fcntl
+import pickle
+import Lazy
+from fractions import Fraction
+from sys import argv
+
+numpy = Lazy.module('numpy')
+
+magic = 'BRS1'
+recordHeader = struct.Struct('<2sHHcQ')
+indexEntry = struct.Struct('<HHcQQ')
+int64Bound = 2 ** 63
+
+# helper functions
+
+# returns the kind and column arrays for a list of values
+# values that are all integers or fractions fitting in int64 are stored exactly, anything else as float64
+def encodeValues(values):
+	exact = True
+	for value in values:
+		if isinstance(value, (int, long)):
+			numerator, denominator = value, 1
+		elif isinstance(value, Fraction):
+			numerator, denominator = value.numerator, value.denominator
+		else:
+			exact = False
+			break
+		if not (-int64Bound <= numerator < int64Bound and denominator < int64Bound):
+			exact = False
+			break
+
+	if exact:
+		numerators = numpy.array([Fraction(value).numerator for value in values], dtype='<i8')
+		denominators = numpy.array([Fraction(value).denominator for value in values], dtype='<i8')
+		return 'q', [numerators, denominators]
+
+	return 'f', [numpy.array(values, dtype='<f8')]
+
+# returns the number of bytes of the columns of a record
+def columnBytes(kind, count):
+	if kind == 'q':
+		return 16 * count
+	return 8 * count
+
+# returns the list of values stored in a record's columns
+def decodeValues(kind, data, count):
+	if kind == 'q':
+		numerators = numpy.frombuffer(data, dtype='<i8', count=count).tolist()
+		denominators = numpy.frombuffer(data, dtype='<i8', count=count, offset=8 * count).tolist()
+		return [numerator if denominator == 1 else Fraction(numerator, denominator) for numerator, denominator in zip(numerators, denominators)]
+
+	return numpy.frombuffer(data, dtype='<f8', count=count).tolist()
+
+# class ResultsStore
+# a store of character values, created if it does not exist, unless create is False, for readers that would otherwise
+# leave an empty store behind (e.g. after a typo in its name) and quietly find no values in it
+
+class ResultsStore:
+	def __init__(self, path, create=True):
+		self.path = path
+		self.indexPath = path + '.idx'
+		self.index = {}
+		self.indexOffset = 0
+
+		if not create and not os.path.exists(path):
+			raise IOError('no results store {}'.format(path))
+		if not os.path.exists(path):
+			with open(path, 'ab') as dataFile:
+				fcntl.flock(dataFile, fcntl.LOCK_EX)
+				if dataFile.tell() == 0:
+					dataFile.write(magic)
+				fcntl.flock(dataFile, fcntl.LOCK_UN)
+
+		with open(path, 'rb') as dataFile:
+			if dataFile.read(len(magic)) != magic:
+				raise ValueError('{} is not a results store, see Results.importPickle'.format(path))
+
+		if not os.path.exists(self.indexPath):
+			self.rebuildIndex()
+		self.refresh()
+
+	# reads index entries written since the last refresh, including by other processes
+	def refresh(self):
+		if not os.path.exists(self.indexPath):
+			return
+
+		with open(self.indexPath, 'rb') as indexFile:
+			indexFile.seek(self.indexOffset)
+			data = indexFile.read()
+
+		# ignore a partially written trailing entry
+		complete = len(data) - len(data) % indexEntry.size
+		for position in xrange(0, complete, indexEntry.size):
+			n, i, kind, offset, count = indexEntry.unpack_from(data, position)
+			self.index[n, i] = kind, offset, count
+		self.indexOffset += complete
+
+	# rewrites the index by scanning the record headers of the data file
+	def rebuildIndex(self):
+		entries = []
+		with open(self.path, 'rb') as dataFile:
+			fcntl.flock(dataFile, fcntl.LOCK_SH)
+			dataFile.seek(len(magic))
+			while True:
+				header = dataFile.read(recordHeader.size)
+				if len(header) < recordHeader.size:
+					break
+				tag, n, i, kind, count = recordHeader.unpack(header)
+				offset = dataFile.tell()
+				entries.append(indexEntry.pack(n, i, kind, offset, count))
+				dataFile.seek(columnBytes(kind, count), 1)
+			with open(self.indexPath, 'wb') as indexFile:
+				indexFile.write(''.join(entries))
+			fcntl.flock(dataFile, fcntl.LOCK_UN)
+
+		self.index = {}
+		self.indexOffset = 0
+
+	# appends the values of the character for (n, i)
+	def append(self, n, i, values):
+		kind, columns = encodeValues(values)
+		with open(self.path, 'ab') as dataFile:
+			fcntl.flock(dataFile, fcntl.LOCK_EX)
+			try:
+				dataFile.seek(0, 2)
+				dataFile.write(recordHeader.pack('RC', n, i, kind, len(values)))
+				offset = dataFile.tell()
+				for column in columns:
+					dataFile.write(column.tobytes())
+				dataFile.flush()
+				os.fsync(dataFile.fileno())
+				with open(self.indexPath, 'ab') as indexFile:
+					indexFile.write(indexEntry.pack(n, i, kind, offset, len(values)))
+			finally:
+				fcntl.flock(dataFile, fcntl.LOCK_UN)
+
+		self.index[n, i] = kind, offset, len(values)
+
+	# returns the list of values of the character for (n, i), or None if it has not been stored
+	def get(self, n, i):
+		if (n, i) not in self.index:
+			self.refresh()
+		if (n, i) not in self.index:
+			return None
+
+		kind, offset, count = self.index[n, i]
+		with open(self.path, 'rb') as dataFile:
+			dataFile.seek(offset)
+			data = dataFile.read(columnBytes(kind, count))
+
+		return decodeValues(kind, data, count)
+
+	# returns the sorted list of (n, i) with stored values
+	def keys(self):
+		self.refresh()
+		return sorted(self.index)
+
+	# returns the sorted list of ((n, i), values) for a given i
+	def records(self, i):
+		return [((k, j), self.get(k, j)) for k, j in self.keys() if j == i]
+
+# imports a stream of pickled ((n, i), values) tuples, as written by old versions of Bonus.characterDump, into a store
+def importPickle(pickleFilename, store):
+	inputFile = open(pickleFilename, 'rb')
+	count = 0
+	while True:
+		try:
+			(n, i), values = pickle.load(inputFile)
+		except EOFError:
+			break
+		store.append(n, i, [value if isinstance(value, (int, long, Fraction)) else float(value) for value in values])
+		count += 1
+
+	inputFile.close()
+
+	return count
+
+# main function, imports a pickle file into a store, given the command line arguments args (without the program name)
+def main(args):
+	if args[0] == 'import':
+		print('imported {} records'.format(importPickle(args[1], ResultsStore(args[2]))))
+
+if __name__ == '__main__':
+	main(argv[1:])
@@ -0,0 +1,257 @@
+# Shards module
+# memory-mapped CSR shards of rows on local disk, for computations whose rows do not fit in memory
+# a shard set is a directory of shards, each holding consecutive rows of the kth exterior power in CSR form as .npy
+# files: the row pointers, the int64 coefficients and the monomials of the terms as k sorted int16 basis indices
+# rows are buffered into a shard until it holds shardCapacity(budget) terms, so writing a shard set holds one shard in
+# memory, and the shards are read back zero-copy by numpy.memmap, one at a time
+# a manifest, written last, marks a shard set as complete
+# rowBasis eliminates rows out of core, keeping its pivots in shards, so memory stays within the budget however large
+# the basis is
+# the budget is BONUS_MEMORY_BUDGET megabytes (default 256), and setting BONUS_SHARD_DIR to a directory on local disk
+# turns on the out-of-core mode of Bonus (see Bonus.shardedCharacter)
+
+import os
+import json
+import shutil
+import tempfile
+import Lazy
+import Action
+import Elimination
+import Instrument
+
+numpy = Lazy.module('numpy')
+
+defaultBudget = int(float(os.environ.get('BONUS_MEMORY_BUDGET', 256)) * 2 ** 20)
+defaultDirectory = os.environ.get('BONUS_SHARD_DIR') or None
+
+manifestName = 'manifest.json'
+
+# estimated bytes of memory per term of a row held as a dict from monomial bitmasks to coefficients, with its share of
+# the dict and of the python integers in it
+dictTermBytes = 160
+
+# helper functions
+
+# returns the number of terms in each shard, and in each block of rows eliminated by rowBasis, for a budget in bytes
+# rowBasis holds a quarter of the budget in each of the block being eliminated, its pivots, the buffer of the shard
+# being written and the shard being read, counting the rows of each as dicts
+def shardCapacity(budget):
+	return max(1, budget / (4 * dictTermBytes))
+
+# returns the path of one of the arrays of a shard
+def arrayPath(directory, shard, name):
+	return os.path.join(directory, 'shard-{:05d}.{}.npy'.format(shard, name))
+
+# returns the manifest of a shard set, or None if it is not complete
+def manifest(directory):
+	try:
+		with open(os.path.join(directory, manifestName)) as manifestFile:
+			return json.load(manifestFile)
+	except (IOError, ValueError):
+		return None
+
+# returns whether a shard set is complete
+def complete(directory):
+	return manifest(directory) is not None
+
+# removes a shard set
+def remove(directory):
+	shutil.rmtree(directory, ignore_errors=True)
+
+# returns the (indptr, coeffs, bits) arrays of a shard, memory-mapped
+def loadShard(directory, shard):
+	return tuple(numpy.load(arrayPath(directory, shard, name), mmap_mode='r') for name in ('indptr', 'coeffs', 'bits'))
+
+# class ShardWriter
+# writes rows, as dicts from monomial bitmasks to integer coefficients, to a new shard set of the kth exterior power of
+# an N dimensional space
+# terms are buffered up to shardCapacity(budget), and each full buffer is saved as a shard
+# coefficients must fit in int64
+
+class ShardWriter:
+	def __init__(self, directory, k, N, budget=defaultBudget):
+		remove(directory)
+		os.makedirs(directory)
+		self.directory = directory
+		self.k = k
+		self.N = N
+		self.capacity = shardCapacity(budget)
+		self.shardRows = []
+		self.numRows = 0
+		self.start()
+
+	# starts a new, empty buffer
+	def start(self):
+		self.indptr = [0]
+		self.coeffs = []
+		self.masks = []
+
+	# saves the buffer as the next shard
+	def flush(self):
+		if len(self.indptr) == 1:
+			return
+
+		shard = len(self.shardRows)
+		numpy.save(arrayPath(self.directory, shard, 'indptr'), numpy.array(self.indptr, dtype=numpy.int64))
+		numpy.save(arrayPath(self.directory, shard, 'coeffs'), numpy.array(self.coeffs, dtype=numpy.int64))
+		numpy.save(arrayPath(self.directory, shard, 'bits'), Action.bitsOf(self.masks, self.k, self.N).astype(numpy.int16))
+		self.shardRows.append(len(self.indptr) - 1)
+		Instrument.count('shards written')
+		self.start()
+
+	def append(self, row):
+		if len(self.coeffs) + len(row) > self.capacity:
+			self.flush()
+
+		masks = sorted(row)
+		self.masks.extend(masks)
+		self.coeffs.extend(row[mask] for mask in masks)
+		self.indptr.append(len(self.coeffs))
+		self.numRows += 1
+
+	# saves the last shard and the manifest, completing the shard set
+	def close(self):
+		self.flush()
+		fd, tempPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+		with os.fdopen(fd, 'w') as tempFile:
+			json.dump({'k': self.k, 'N': self.N, 'rows': self.numRows, 'shards': self.shardRows}, tempFile)
+		os.rename(tempPath, os.path.join(self.directory, manifestName))
+
+# writes an iterable of rows to a new shard set of the kth exterior power of an N dimensional space, returning the
+# number of rows
+def write(directory, k, N, rows, budget=defaultBudget):
+	writer = ShardWriter(directory, k, N, budget)
+	for row in rows:
+		writer.append(row)
+	writer.close()
+
+	return writer.numRows
+
+# generates the (indptr, coeffs, bits) arrays of the shards of a complete shard set, memory-mapped
+def shardArrays(directory):
+	for shard in range(len(manifest(directory)['shards'])):
+		yield loadShard(directory, shard)
+
+# generates the rows of a shard set as dicts from monomial bitmasks to coefficients, one shard mapped at a time
+# if sparsestFirst is set, the rows of each shard are generated in order of their number of terms (Markowitz order)
+def rows(directory, sparsestFirst=False):
+	N = manifest(directory)['N']
+	for indptr, coeffs, bits in shardArrays(directory):
+		masks = Action.masksOf(bits, Action.maskDtype(N)).tolist()
+		coeffs, indptr = coeffs.tolist(), indptr.tolist()
+		order = range(len(indptr) - 1)
+		if sparsestFirst:
+			order = numpy.argsort(numpy.diff(indptr), kind='mergesort').tolist()
+		for j in order:
+			yield dict(zip(masks[indptr[j]:indptr[j + 1]], coeffs[indptr[j]:indptr[j + 1]]))
+
+# generates the shards of a shard set as Action.ElementBatches, whose coefficients and monomials are the memory-mapped
+# arrays
+def batches(directory):
+	k, N = manifest(directory)['k'], manifest(directory)['N']
+	for indptr, coeffs, bits in shardArrays(directory):
+		batch = Action.ElementBatch([], k, N)
+		batch.setTerms(k, N, indptr, coeffs, Action.masksOf(bits, Action.maskDtype(N)), bits)
+		yield batch
+
+# out-of-core elimination
+
+# class ShardPivots
+# the rows of a shard of pivots of an N dimensional space, as a mapping from leading monomials to rows (dicts from
+# monomial bitmasks to coefficients), to reduce rows against with an Elimination.Eliminator
+# only the monomials and an index of the leading monomials are held in memory, and each row is built from the
+# memory-mapped arrays when it is looked up
+
+class ShardPivots:
+	def __init__(self, directory, shard, N):
+		indptr, self.coeffs, bits = loadShard(directory, shard)
+		self.indptr = indptr.tolist()
+		self.masks = Action.masksOf(bits, Action.maskDtype(N))
+		self.index = dict(zip(self.masks[indptr[:-1]].tolist(), range(len(self.indptr) - 1)))
+
+	def __len__(self):
+		return len(self.index)
+
+	def __contains__(self, lead):
+		return lead in self.index
+
+	def __getitem__(self, lead):
+		return self.row(self.index[lead])
+
+	# returns the jth row of the shard
+	def row(self, j):
+		start, stop = self.indptr[j], self.indptr[j + 1]
+		return dict(zip(self.masks[start:stop].tolist(), self.coeffs[start:stop].tolist()))
+
+	# generates the rows of the shard, in order
+	def rows(self):
+		for j in xrange(len(self.indptr) - 1):
+			yield self.row(j)
+
+# reduces rows in place against a shard of pivots in reduced echelon form
+def reduceRows(rows, pivots):
+	eliminator = Elimination.Eliminator(pivots=pivots)
+	for row in rows:
+		eliminator.reduce(row)
+
+# generates the rows of an iterable in consecutive lists of about capacity terms
+def rowBlocks(rows, capacity):
+	block, terms = [], 0
+	for row in rows:
+		block.append(row)
+		terms += len(row)
+		if terms >= capacity:
+			yield block
+			block, terms = [], 0
+	if block:
+		yield block
+
+# eliminates an iterable of rows of the kth exterior power of an N dimensional space out of core, writing a basis for
+# their span, in reduced echelon form, to a new shard set in directory, and returns its number of rows
+# total is the number of rows, or an upper bound on it, for progress reports
+# rows are eliminated in blocks of shardCapacity(budget) terms: each block is reduced against the pivot shards found so
+# far, one memory-mapped shard at a time in the order they were written, then eliminated in memory, and its pivots, in
+# reduced echelon form among themselves, are written as the next pivot shards (in directory.pivots)
+# so each pivot shard is free of the leading monomials of the shards before it, but not of those after it, and the
+# shards are back-substituted from the last to the first, each against the finished shards after it, one at a time
+# pivots in reduced echelon form with respect to each other reduce a row in a single pass, in any order, so no shard
+# is ever needed twice for a row; only the blocks and shards in use are held in memory
+# (coefficients must stay within int64)
+def rowBasis(rows, directory, k, N, budget=defaultBudget, total=None):
+	pivotDirectory = directory + '.pivots'
+	pivotWriter = ShardWriter(pivotDirectory, k, N, budget)
+	progress = Instrument.Progress('sharded elimination', total)
+	with Instrument.stage('sharded elimination', detail=True):
+		for block in rowBlocks(rows, shardCapacity(budget)):
+			for shard in range(len(pivotWriter.shardRows)):
+				reduceRows(block, ShardPivots(pivotDirectory, shard, N))
+			eliminator = Elimination.Eliminator()
+			for row in block:
+				Instrument.count('rows')
+				if eliminator.insert(row):
+					Instrument.count('pivots')
+			progress.step(len(block))
+			block = None
+			for row in eliminator.basis(reduced=True):
+				pivotWriter.append(row)
+			eliminator = None
+			pivotWriter.flush()
+		pivotWriter.close()
+
+	writer = ShardWriter(directory, k, N, budget)
+	progress = Instrument.Progress('back substitution', len(pivotWriter.shardRows))
+	with Instrument.stage('back substitution', detail=True):
+		for shard in reversed(range(len(pivotWriter.shardRows))):
+			block = list(ShardPivots(pivotDirectory, shard, N).rows())
+			for finished in range(len(writer.shardRows)):
+				reduceRows(block, ShardPivots(directory, finished, N))
+			for row in block:
+				Elimination.makePrimitive(row, min(row))
+				writer.append(row)
+			block = None
+			writer.flush()
+			progress.step()
+		writer.close()
+	remove(pivotDirectory)
+
+	return writer.numRows
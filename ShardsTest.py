@@ -0,0 +1,53 @@
+# ShardsTest module
+# tests of the out-of-core mode: characters computed from shards, and the peak memory of computing them
+# USAGE: python ShardsTest.py
+
+import os
+import shutil
+import resource
+import tempfile
+import unittest
+import multiprocessing
+import Bonus
+import Shards
+
+# budget in bytes for the memory test, which is well under the memory needed to eliminate the ideal in memory
+memoryBudget = 4 * 2 ** 20
+
+# returns the peak resident memory of the process in bytes
+def peakBytes():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# computes character(n, i) out of core in directory, first computing a smaller character to import and warm up
+# everything it uses, and puts the character and the growth of the peak memory during the computation on results
+def measuredCharacter(n, i, directory, budget, results):
+	Bonus.shardedCharacter(n, 3, directory, budget)
+	Bonus.characterExtV(n, i)
+	before = peakBytes()
+	values = Bonus.shardedCharacter(n, i, directory, budget)
+	results.put((values, peakBytes() - before))
+
+class ShardedCharacterTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def testMatchesInMemory(self):
+		for n, i in ((4, 2), (5, 3), (6, 4)):
+			self.assertEqual(Bonus.shardedCharacter(n, i, self.directory, 2 ** 17), Bonus.character(n, i))
+
+	# run in a fresh process, so the peak memory is that of the computation alone
+	def testPeakMemory(self):
+		results = multiprocessing.Queue()
+		process = multiprocessing.Process(target=measuredCharacter, args=(7, 4, self.directory, memoryBudget, results))
+		process.start()
+		values, growth = results.get()
+		process.join()
+		self.assertEqual(values, Bonus.character(7, 4))
+		self.assertGreater(len(Shards.manifest(os.path.join(self.directory, 'ideal-7-4'))['shards']), 1)
+		self.assertLessEqual(growth, memoryBudget)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,21 +1,99 @@
 # Subsets module
 # codes functions for obtaining and indexing subsets of range(m, n)
+# subsets of nonnegative integers can also be ranked without listing them, by the combinatorial number system:
+# the k-subset c_0 < c_1 < ... < c_{k-1} has rank C(c_0, 1) + C(c_1, 2) + ... + C(c_{k-1}, k),
+# which is its position among all k-subsets ordered colexicographically (by largest element, then the next largest, ...)
+
+from itertools import combinations
+
+# binomial coefficients computed so far, row a holding C(a, 0), C(a, 1), ..., C(a, a)
+binomialRows = [[1]]
+
+# returns C(a, b), extending the table of binomial coefficients as needed
+def binomial(a, b):
+	if b < 0 or b > a:
+		return 0
+	while len(binomialRows) <= a:
+		previous = binomialRows[-1]
+		binomialRows.append([1] + [previous[j] + previous[j + 1] for j in range(len(previous) - 1)] + [1])
+
+	return binomialRows[a][b]
 
 # returns a list of all subsets of s of size k, in the form of sorted lists
 # assumes s is sorted
 def subsets(s, k):
-	if len(s) < k:
-		return []
-	if k == 0:
-		return [[]]
+	return list(iterSubsets(s, k))
+
+# generates all subsets of s of size k, in the form of sorted lists, in lexicographic order
+# assumes s is sorted
+def iterSubsets(s, k):
+	for subset in combinations(s, k):
+		yield list(subset)
+
+# returns the rank of a subset of nonnegative integers (as a sorted list) in the combinatorial number system
+def rank(subset):
+	result = 0
+	for t in range(len(subset)):
+		result += binomial(subset[t], t + 1)
+
+	return result
 
-	smallSubsets = map(lambda x: [s[0]] + x, subsets(s[1:], k - 1))	# subsets starting with s[0]
-	largeSubsets = subsets(s[1:], k)								# subsets starting with larger elts
+# returns the k-subset of nonnegative integers (as a sorted list) of a given rank in the combinatorial number system
+def unrank(r, k):
+	result = []
+	for t in range(k, 0, -1):
+		# find the largest c with C(c, t) <= r, by doubling and then bisecting
+		low, high = t - 1, t
+		while binomial(high, t) <= r:
+			low, high = high, 2 * high
+		while high - low > 1:
+			middle = (low + high) / 2
+			if binomial(middle, t) <= r:
+				low = middle
+			else:
+				high = middle
+		result.append(low)
+		r -= binomial(low, t)
 
-	return smallSubsets + largeSubsets
+	result.reverse()
+
+	return result
+
+# returns the rank of a subset of nonnegative integers, given as a bitmask, in the combinatorial number system
+def rankMask(mask):
+	result = 0
+	t, b = 1, 0
+	while mask:
+		if mask & 1:
+			result += binomial(b, t)
+			t += 1
+		mask >>= 1
+		b += 1
+
+	return result
+
+# returns the bitmask of the k-subset of nonnegative integers of a given rank in the combinatorial number system
+def unrankMask(r, k):
+	mask = 0
+	for b in unrank(r, k):
+		mask |= 1 << b
+
+	return mask
 
 # returns a dictionary from subsets of s of size k (as tuples) to indices
 def indices(s, k):
 	tuples = map(tuple, subsets(s, k))
 
 	return dict(zip(tuples, range(len(tuples))))
+
+# returns a dictionary from subsets of s of size k (as bitmasks over the elements of s) to indices
+# assumes s is a sorted list of nonnegative integers
+def maskIndices(s, k):
+	masks = []
+	for subset in subsets(s, k):
+		mask = 0
+		for b in subset:
+			mask |= 1 << b
+		masks.append(mask)
+
+	return dict(zip(masks, range(len(masks))))
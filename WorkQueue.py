@@ -0,0 +1,405 @@
+# WorkQueue module
+# distributes the computation of characters over many processes and machines through a queue of tasks
+# USAGE: python WorkQueue.py coordinate m n i filename queue [chunkSize]
+#        python WorkQueue.py work queue
+#        python WorkQueue.py serve host port queuefile
+#        python WorkQueue.py local m n i filename processes
+#
+# a task computes the values of the ideal character of V_n on a slice of the cycle types of S_n
+# the coordinator enqueues the tasks of the characters on V_m through V_n that are not in the results store filename,
+# assembles the results of the tasks of each character as they complete, and writes it to the store exactly once
+# workers lease tasks, renewing their leases while they work; a task whose lease expires (e.g. its worker died) is
+# leased again, up to maxAttempts times, after which it is marked failed, and a result is only accepted once per task
+# queue is the path of an SQLite queue file, shared by processes on one machine or over a shared filesystem,
+# or host:port of a queue server (the serve form), which serves an SQLite queue file over TCP to a cluster
+# the local form runs a coordinator and processes workers on one machine, through a temporary SQLite queue
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import platform
+import tempfile
+import threading
+import SocketServer
+import Perm
+import Results
+import Instrument
+from fractions import Fraction
+from sys import argv
+
+# default number of leases of a task before it is marked failed, duration of leases, and polling interval, in seconds
+maxAttempts = 3
+leaseSeconds = 600.
+pollSeconds = 1.
+
+# helper functions
+
+# returns the JSON form of a list of character values, with fractions as [numerator, denominator]
+def jsonValues(values):
+	return [[value.numerator, value.denominator] if isinstance(value, Fraction) else value for value in values]
+
+# returns the list of character values of its JSON form
+def valuesFromJson(values):
+	return [Fraction(*value) if isinstance(value, list) else value for value in values]
+
+# returns the id of the task of a slice of the cycle types of S_n
+def taskId(n, i, start, stop):
+	return '{}-{}-{}-{}'.format(n, i, start, stop)
+
+# returns the default number of cycle types of S_n per task, giving about 8 tasks per character
+def defaultChunkSize(n):
+	return max(1, Perm.partitionCount(1, n) / 8)
+
+# returns the list of (id, task) of the tasks of the character on V_n, in slices of chunkSize cycle types
+def characterTasks(n, i, chunkSize=None):
+	chunkSize = chunkSize or defaultChunkSize(n)
+	numCycleTypes = Perm.partitionCount(1, n)
+	return [(taskId(n, i, start, min(start + chunkSize, numCycleTypes)), {'n': n, 'i': i, 'start': start, 'stop': min(start + chunkSize, numCycleTypes)})
+		for start in xrange(0, numCycleTypes, chunkSize)]
+
+# class SQLiteQueue
+# a queue of tasks in an SQLite database, safe for concurrent use by several processes
+# a connection is opened per operation, so a queue can be shared by threads and forked processes
+
+class SQLiteQueue:
+	def __init__(self, path, maxAttempts=maxAttempts):
+		self.path = path
+		self.maxAttempts = maxAttempts
+		connection = self.connect()
+		connection.execute('CREATE TABLE IF NOT EXISTS tasks (id TEXT PRIMARY KEY, task TEXT, state TEXT, worker TEXT, expiry REAL, attempts INTEGER, result TEXT)')
+		connection.close()
+
+	def connect(self):
+		return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+	# adds tasks, given as (id, task) pairs, ignoring those already in the queue
+	def put(self, tasks):
+		connection = self.connect()
+		try:
+			connection.execute('BEGIN IMMEDIATE')
+			connection.executemany("INSERT OR IGNORE INTO tasks VALUES (?, ?, 'pending', NULL, 0, 0, NULL)",
+				[(taskId, json.dumps(task)) for taskId, task in tasks])
+			connection.execute('COMMIT')
+		finally:
+			connection.close()
+
+	# leases a pending task, or one whose lease has expired, to a worker for a number of seconds
+	# returns (id, task), or None if there is no task to lease
+	def lease(self, worker, seconds):
+		now = time.time()
+		connection = self.connect()
+		try:
+			connection.execute('BEGIN IMMEDIATE')
+			connection.execute("UPDATE tasks SET state = 'failed' WHERE state = 'leased' AND expiry < ? AND attempts >= ?", (now, self.maxAttempts))
+			row = connection.execute("SELECT id, task FROM tasks WHERE state = 'pending' OR (state = 'leased' AND expiry < ?) ORDER BY rowid LIMIT 1", (now,)).fetchone()
+			if row is not None:
+				connection.execute("UPDATE tasks SET state = 'leased', worker = ?, expiry = ?, attempts = attempts + 1 WHERE id = ?", (worker, now + seconds, row[0]))
+			connection.execute('COMMIT')
+		finally:
+			connection.close()
+
+		if row is None:
+			return None
+		return row[0], json.loads(row[1])
+
+	# extends the lease of a task held by a worker, returning whether the worker still holds it
+	def renew(self, taskId, worker, seconds):
+		connection = self.connect()
+		try:
+			cursor = connection.execute("UPDATE tasks SET expiry = ? WHERE id = ? AND worker = ? AND state = 'leased'", (time.time() + seconds, taskId, worker))
+			return cursor.rowcount == 1
+		finally:
+			connection.close()
+
+	# records the result of a task, returning whether it was accepted
+	# only the first result of a task is accepted, even from a worker whose lease has expired, since tasks are deterministic
+	def complete(self, taskId, worker, result):
+		connection = self.connect()
+		try:
+			cursor = connection.execute("UPDATE tasks SET state = 'done', worker = ?, result = ? WHERE id = ? AND state != 'done'", (worker, json.dumps(result), taskId))
+			return cursor.rowcount == 1
+		finally:
+			connection.close()
+
+	# gives up a task held by a worker after an error, to be retried unless it has been leased maxAttempts times
+	def fail(self, taskId, worker):
+		connection = self.connect()
+		try:
+			connection.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+				(self.maxAttempts, taskId, worker))
+		finally:
+			connection.close()
+
+	# returns a dict from the ids of the given tasks that are done to their results
+	def results(self, taskIds):
+		connection = self.connect()
+		try:
+			result = {}
+			for start in xrange(0, len(taskIds), 500):
+				chunk = taskIds[start:start + 500]
+				query = "SELECT id, result FROM tasks WHERE state = 'done' AND id IN ({})".format(', '.join('?' * len(chunk)))
+				result.update((row[0], json.loads(row[1])) for row in connection.execute(query, chunk))
+			return result
+		finally:
+			connection.close()
+
+	# returns a dict from states to the numbers of tasks in them
+	def status(self):
+		connection = self.connect()
+		try:
+			return dict(connection.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+		finally:
+			connection.close()
+
+# the socket backend
+# a queue server answers requests, each a line of JSON {"method": name, "args": [...]}, with a line of JSON
+# {"result": value} or {"error": message}, calling the methods of a queue one at a time
+
+queueMethods = set(['put', 'lease', 'renew', 'complete', 'fail', 'results', 'status'])
+
+class QueueRequestHandler(SocketServer.StreamRequestHandler):
+	def handle(self):
+		for line in self.rfile:
+			# malformed requests are answered with an error like any other failure
+			try:
+				request = json.loads(line)
+				if request['method'] not in queueMethods:
+					raise ValueError('unknown method {}'.format(request['method']))
+				with self.server.lock:
+					response = {'result': getattr(self.server.queue, request['method'])(*request['args'])}
+			except Exception as error:
+				response = {'error': '{}: {}'.format(type(error).__name__, error)}
+			self.wfile.write(json.dumps(response) + '\n')
+			self.wfile.flush()
+
+class QueueServer(SocketServer.ThreadingTCPServer):
+	allow_reuse_address = True
+	daemon_threads = True
+
+	def __init__(self, address, queue):
+		SocketServer.ThreadingTCPServer.__init__(self, address, QueueRequestHandler)
+		self.queue = queue
+		self.lock = threading.Lock()
+
+# class SocketQueue
+# a client of a queue server, with the same methods as SQLiteQueue
+
+class SocketQueue:
+	def __init__(self, host, port):
+		self.address = host, port
+
+	def call(self, method, *args):
+		connection = socket.create_connection(self.address)
+		try:
+			stream = connection.makefile('rw')
+			stream.write(json.dumps({'method': method, 'args': args}) + '\n')
+			stream.flush()
+			response = json.loads(stream.readline())
+		finally:
+			connection.close()
+
+		if 'error' in response:
+			raise RuntimeError('queue server: ' + response['error'])
+		return response['result']
+
+	def put(self, tasks):
+		return self.call('put', tasks)
+
+	def lease(self, worker, seconds):
+		return self.call('lease', worker, seconds)
+
+	def renew(self, taskId, worker, seconds):
+		return self.call('renew', taskId, worker, seconds)
+
+	def complete(self, taskId, worker, result):
+		return self.call('complete', taskId, worker, result)
+
+	def fail(self, taskId, worker):
+		return self.call('fail', taskId, worker)
+
+	def results(self, taskIds):
+		return self.call('results', taskIds)
+
+	def status(self):
+		return self.call('status')
+
+# returns the queue of a queue argument, either host:port of a queue server or the path of an SQLite queue file
+def openQueue(spec):
+	host, separator, port = spec.rpartition(':')
+	if separator and port.isdigit():
+		return SocketQueue(host, int(port))
+
+	return SQLiteQueue(spec)
+
+# coordinator and workers
+
+# enqueues the tasks of the characters on V_m through V_n not in the results store filename, and writes each character
+# to the store once all its tasks are done, returning once all are written
+# tasks are slices of chunkSize cycle types (see defaultChunkSize)
+# raises RuntimeError if a task fails for good
+def coordinate(m, n, i, queue, filename, chunkSize=None):
+	import Bonus
+
+	store = Results.ResultsStore(filename)
+	taskIds = {}
+	for k in xrange(m, n + 1):
+		if store.get(k, i) is not None:
+			continue
+		if i < 2:
+			# the ideal is trivial, so there is nothing to distribute
+			store.append(k, i, Bonus.character(k, i))
+			continue
+		tasks = characterTasks(k, i, chunkSize)
+		queue.put(tasks)
+		taskIds[k] = [taskId for taskId, task in tasks]
+
+	progress = Instrument.Progress('distributed characters', sum(len(ids) for ids in taskIds.itervalues()), m=m, n=n, i=i)
+	finished = 0
+	while taskIds:
+		done = finished
+		for k in sorted(taskIds):
+			results = queue.results(taskIds[k])
+			done += len(results)
+			if len(results) < len(taskIds[k]):
+				continue
+
+			# all tasks of the character are done, so assemble and store it, unless another coordinator already has
+			idealVals = sum((valuesFromJson(results[taskId]) for taskId in taskIds[k]), [])
+			values = [extVVal - idealVal for extVVal, idealVal in zip(Bonus.characterExtV(k, i), idealVals)]
+			if store.get(k, i) is None:
+				store.append(k, i, values)
+			finished += len(results)
+			del taskIds[k]
+		progress.step(done - progress.done)
+
+		if taskIds:
+			failed = queue.status().get('failed', 0)
+			if failed:
+				raise RuntimeError('{} tasks failed, see the queue for details'.format(failed))
+			time.sleep(pollSeconds)
+
+# returns the values of the ideal character for a task
+# the ideal basis of the most recent (n, i) is kept, since consecutive tasks mostly share it
+workerBatches = {}
+
+def taskValues(task):
+	import Bonus
+	import Action
+
+	n, i = task['n'], task['i']
+	if (n, i) not in workerBatches:
+		workerBatches.clear()
+		workerBatches[n, i] = Action.ElementBatch(Bonus.cachedIdeal(n, i), i, len(Bonus.V(n)))
+
+	cycleTypes = Perm.partitions(1, n)[task['start']:task['stop']]
+	return [Bonus.charVal(n, i, workerBatches[n, i], Perm.fromCycleType(n, cycleType)) for cycleType in cycleTypes]
+
+# class LeaseKeeper
+# a thread renewing the lease of a task while a worker computes it
+
+class LeaseKeeper(threading.Thread):
+	def __init__(self, queue, taskId, worker, seconds):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.queue = queue
+		self.taskId = taskId
+		self.worker = worker
+		self.seconds = seconds
+		self.finished = threading.Event()
+
+	def run(self):
+		while not self.finished.wait(self.seconds / 3):
+			try:
+				self.queue.renew(self.taskId, self.worker, self.seconds)
+			except Exception:
+				pass
+
+	def stop(self):
+		self.finished.set()
+		self.join()
+
+# runs tasks from a queue until no task is pending or leased, returning the number of tasks completed
+# a task raising an error is given back to the queue to be retried
+# an empty queue normally means the coordinator has not enqueued anything yet, so the worker waits; in local mode the
+# tasks are enqueued before the workers start, so an empty queue means there is nothing to do
+def work(queue, worker=None, seconds=leaseSeconds, local=False):
+	if worker is None:
+		worker = '{}:{}'.format(platform.node(), os.getpid())
+
+	completed = 0
+	while True:
+		leased = queue.lease(worker, seconds)
+		if leased is None:
+			status = queue.status()
+			if (status or local) and not status.get('pending') and not status.get('leased'):
+				return completed
+			time.sleep(pollSeconds)
+			continue
+
+		taskId, task = leased
+		keeper = LeaseKeeper(queue, taskId, worker, seconds)
+		keeper.start()
+		try:
+			with Instrument.stage('task', detail=True, task=taskId, worker=worker):
+				values = taskValues(task)
+		except Exception as error:
+			keeper.stop()
+			print('task {} failed: {}'.format(taskId, error))
+			queue.fail(taskId, worker)
+			continue
+		keeper.stop()
+
+		queue.complete(taskId, worker, jsonValues(values))
+		completed += 1
+
+# computes the characters on V_m through V_n into the results store filename with a coordinator and processes workers
+# on this machine, through a temporary SQLite queue, or through the given queue
+def localRun(m, n, i, filename, processes, queue=None):
+	from multiprocessing import Process
+
+	directory = None
+	if queue is None:
+		directory = tempfile.mkdtemp()
+		queue = SQLiteQueue(os.path.join(directory, 'queue.sqlite'))
+
+	workers = []
+	try:
+		# enqueue the tasks before starting the workers, which stop once there is nothing left to do
+		# if nothing is enqueued (i < 2, or all characters are already stored), the coordinator needs no workers
+		store = Results.ResultsStore(filename)
+		enqueued = False
+		for k in xrange(m, n + 1):
+			if i >= 2 and store.get(k, i) is None:
+				queue.put(characterTasks(k, i))
+				enqueued = True
+		if enqueued:
+			workers = [Process(target=work, args=(queue, 'local:{}'.format(j), leaseSeconds, True))
+				for j in range(processes)]
+		for process in workers:
+			process.start()
+		coordinate(m, n, i, queue, filename)
+	finally:
+		for process in workers:
+			process.join()
+		if directory is not None:
+			for name in os.listdir(directory):
+				os.remove(os.path.join(directory, name))
+			os.rmdir(directory)
+
+# main function, runs a coordinator, a worker, a queue server or a local run, given the command line arguments args
+# (without the program name)
+def main(args):
+	Instrument.listeners.append(Instrument.consoleProgress)
+	if args[0] == 'coordinate':
+		coordinate(int(args[1]), int(args[2]), int(args[3]), openQueue(args[5]), args[4], *map(int, args[6:7]))
+	elif args[0] == 'work':
+		print('completed {} tasks'.format(work(openQueue(args[1]))))
+	elif args[0] == 'serve':
+		QueueServer((args[1], int(args[2])), SQLiteQueue(args[3])).serve_forever()
+	elif args[0] == 'local':
+		localRun(int(args[1]), int(args[2]), int(args[3]), args[4], int(args[5]))
+
+if __name__ == '__main__':
+	main(argv[1:])
@@ -0,0 +1,77 @@
+# WorkQueueTest module
+# smoke tests of local runs of the work queue and of the queue server
+# USAGE: python WorkQueueTest.py
+
+import os
+import json
+import socket
+import shutil
+import threading
+import tempfile
+import unittest
+import multiprocessing
+import Results
+import WorkQueue
+
+# seconds a local run may take before it is considered hung
+timeoutSeconds = 60
+
+# runs WorkQueue.localRun in a separate process, returning its exit code, or None if it did not finish in time
+def timedLocalRun(m, n, i, filename, processes):
+	process = multiprocessing.Process(target=WorkQueue.localRun, args=(m, n, i, filename, processes))
+	process.start()
+	process.join(timeoutSeconds)
+	if process.is_alive():
+		process.terminate()
+		process.join()
+		return None
+
+	return process.exitcode
+
+class LocalRunTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, 'results')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	# i < 2 enqueues nothing, so the run must finish without waiting on workers
+	def testTrivialIdeal(self):
+		self.assertEqual(timedLocalRun(3, 4, 1, self.filename, 2), 0)
+		self.assertIsNotNone(Results.ResultsStore(self.filename).get(4, 1))
+
+	# every character already stored enqueues nothing either
+	def testAlreadyStored(self):
+		self.assertEqual(timedLocalRun(3, 4, 2, self.filename, 2), 0)
+		self.assertEqual(timedLocalRun(3, 4, 2, self.filename, 2), 0)
+		self.assertIsNotNone(Results.ResultsStore(self.filename).get(4, 2))
+
+class QueueServerTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.server = WorkQueue.QueueServer(('127.0.0.1', 0), WorkQueue.SQLiteQueue(os.path.join(self.directory, 'queue')))
+		self.thread = threading.Thread(target=self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		shutil.rmtree(self.directory)
+
+	# a malformed request gets an error reply, and the connection keeps serving
+	def testMalformedRequest(self):
+		connection = socket.create_connection(self.server.server_address)
+		stream = connection.makefile('rw')
+		stream.write('{"method": "status", "ar\n')
+		stream.flush()
+		self.assertIn('error', json.loads(stream.readline()))
+		stream.write(json.dumps({'method': 'status', 'args': []}) + '\n')
+		stream.flush()
+		self.assertEqual(json.loads(stream.readline()), {'result': {}})
+		stream.close()
+		connection.close()
+
+if __name__ == '__main__':
+	unittest.main()